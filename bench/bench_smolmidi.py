@@ -0,0 +1,230 @@
+"""Benchmarks for winterbloom_smolmidi's MIDI parsers.
+
+Runs on CPython against a fake port that has the whole workload available
+up front, which is what a busy USB MIDI port looks like to the parser:
+
+    python bench/bench_smolmidi.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+import winterbloom_smolmidi as smolmidi  # noqa: E402
+
+
+class FakePort:
+    """Stands in for usb_midi.PortIn, counting calls to readinto."""
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self.reads = 0
+
+    def readinto(self, buf, nbytes=None):
+        self.reads += 1
+        if nbytes is None:
+            nbytes = len(buf)
+        count = min(nbytes, len(self._data) - self._pos)
+        buf[:count] = self._data[self._pos : self._pos + count]
+        self._pos += count
+        return count
+
+
+def aftertouch_and_clock(repeats):
+    """A dense burst of poly aftertouch with MIDI clock mixed in."""
+    chunk = bytearray()
+    for n in range(repeats):
+        chunk += bytes((smolmidi.AFTERTOUCH, 60, n % 128))
+        chunk += bytes((smolmidi.AFTERTOUCH | 1, 64, n % 128))
+        chunk += bytes((smolmidi.CLOCK,))
+    return bytes(chunk)
+
+
+def run(midi_in_cls, data):
+    port = FakePort(data)
+    midi_in = midi_in_cls(port)
+    msg = smolmidi.Message()
+    count = 0
+    start = time.perf_counter()
+    while midi_in.receive(msg) is not None:
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count, elapsed, port.reads
+
+
+def sysex_dump(length):
+    """A large sysex message, like a patch or calibration dump."""
+    data = bytes(n % 128 for n in range(length))
+    return bytes((smolmidi.SYSEX,)) + data + bytes((smolmidi.SYSEX_END,))
+
+
+def receive_sysex(midi_in, length):
+    midi_in.receive()
+    data, _ = midi_in.receive_sysex(length)
+    return len(data)
+
+
+def receive_sysex_into(midi_in, length):
+    chunk = bytearray(256)
+    received = [0]
+
+    def on_chunk(buf, count):
+        received[0] += count
+
+    midi_in.receive()
+    midi_in.receive_sysex_into(chunk, on_chunk)
+    return received[0]
+
+
+def run_sysex(midi_in_cls, receive, data, length):
+    port = FakePort(data)
+    midi_in = midi_in_cls(port)
+    tracemalloc.start()
+    start = time.perf_counter()
+    received = receive(midi_in, length)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert received == length
+    return elapsed, port.reads, peak
+
+
+class SetsMidiIn(smolmidi.MidiIn):
+    """MidiIn with receive as it was before _STATUS_TABLE, working out the
+    message's type, channel and length with a range check and set
+    membership tests. Everything else is the same as MidiIn.receive."""
+
+    def receive(self, into=None):
+        if self._outstanding_sysex:
+            self.receive_sysex(0)
+
+        result = self._port.readinto(self._read_buf, 1)
+        if not result:
+            return None
+
+        message = into or self._pool.peek()
+        message.timestamp = smolmidi.ticks_us()
+        data_bytes = message._data
+        length = 0
+
+        status_byte = self._read_buf[0]
+        is_status = status_byte & 0x80
+        if not is_status:
+            if self._running_status_enabled and self._running_status:
+                data_bytes[0] = status_byte
+                length = 1
+                status_byte = self._running_status
+            else:
+                self._error_count += 1
+                return None
+
+        if smolmidi._is_channel_message(status_byte):
+            self._running_status = status_byte
+            message.type = status_byte & 0xF0
+            message.channel = status_byte & 0x0F
+        else:
+            message.type = status_byte
+            message.channel = None
+
+        if message.type in smolmidi._LEN_2_MESSAGES:
+            smolmidi._read_n_bytes(self._port, self._read_buf, data_bytes, length, 2)
+            message.data = data_bytes
+        elif message.type in smolmidi._LEN_1_MESSAGES:
+            smolmidi._read_n_bytes(self._port, self._read_buf, data_bytes, length, 1)
+            message.data = message._data_1
+        else:
+            message.data = None
+
+        if message.type == smolmidi.SYSEX:
+            self._outstanding_sysex = True
+
+        for b in message.data or ():
+            if b & 0x80:
+                self._error_count += 1
+                return None
+
+        if not self._accepts(status_byte, data_bytes[0]):
+            return None
+
+        if into is None:
+            self._pool.take()
+        return message
+
+
+def all_status_bytes():
+    """Every status byte followed by as many data bytes as it takes."""
+    data = bytearray()
+    for status_byte in range(0x80, 0x100):
+        if status_byte in (smolmidi.SYSEX, smolmidi.SYSEX_END):
+            continue
+        length = smolmidi._STATUS_TABLE[status_byte] & smolmidi._DATA_LENGTH
+        data += bytes((status_byte,)) + bytes(range(1, length + 1))
+    return bytes(data)
+
+
+def decoded(midi_in_cls, data):
+    midi_in = midi_in_cls(FakePort(data))
+    messages = []
+    while True:
+        msg = midi_in.receive()
+        if msg is None:
+            return messages
+        messages.append((msg.type, msg.channel, bytes(msg.data or b"")))
+
+
+def main():
+    data = aftertouch_and_clock(20000)
+    print(
+        "{:<16} {:>10} {:>14} {:>10}".format(
+            "parser", "messages", "messages/s", "reads/msg"
+        )
+    )
+    for midi_in_cls in (smolmidi.MidiIn, smolmidi.BufferedMidiIn):
+        count, elapsed, reads = run(midi_in_cls, data)
+        print(
+            "{:<16} {:>10} {:>14.0f} {:>10.2f}".format(
+                midi_in_cls.__name__, count, count / elapsed, reads / count
+            )
+        )
+
+    print()
+    length = 16384
+    data = sysex_dump(length)
+    print(
+        "{:<36} {:>10} {:>10} {:>12}".format(
+            "sysex ({} bytes)".format(length), "ms", "reads", "peak bytes"
+        )
+    )
+    for midi_in_cls, receive in (
+        (smolmidi.MidiIn, receive_sysex),
+        (smolmidi.BufferedMidiIn, receive_sysex),
+        (smolmidi.BufferedMidiIn, receive_sysex_into),
+    ):
+        elapsed, reads, peak = run_sysex(midi_in_cls, receive, data, length)
+        name = midi_in_cls.__name__ + "." + receive.__name__
+        print(
+            "{:<36} {:>10.2f} {:>10} {:>12}".format(
+                name, elapsed * 1000, reads, peak
+            )
+        )
+
+    print()
+    # The table has to decode every status byte the way the sets did.
+    data = all_status_bytes()
+    assert decoded(SetsMidiIn, data) == decoded(smolmidi.MidiIn, data)
+    data = aftertouch_and_clock(20000)
+    print("{:<16} {:>14}".format("status decode", "ns/message"))
+    for name, midi_in_cls in (("sets", SetsMidiIn), ("table", smolmidi.MidiIn)):
+        # Best of a few runs, the difference is small next to the noise.
+        runs = [run(midi_in_cls, data) for _ in range(5)]
+        count = runs[0][0]
+        elapsed = min(elapsed for _, elapsed, _ in runs)
+        print("{:<16} {:>14.1f}".format(name, elapsed / count * 1e9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""Benchmarks for the firmware's hot paths.
+
+Runs fixed workloads on CPython against the solsim hardware stand-ins and
+reports operations per second and allocations for each of them::
+
+    python bench/bench_suite.py
+    python bench/bench_suite.py --json report.json
+    python bench/bench_suite.py --compare bench/baseline.json
+
+Time-based components (envelopes, LFOs, slew limiters, RedBlue) run on the
+simulator's virtual clock, which moves forward 1 ms per operation, so every
+run does exactly the same work.
+
+Allocations are measured over a batch of operations: ``alloc_peak_bytes``
+is the most memory tracemalloc saw allocated at once while running them,
+``alloc_blocks_net`` the number of memory blocks still held afterwards,
+not counting the benchmark harness's own.
+CPython allocates every float and large int, so these aren't 0 even where
+the device doesn't allocate. They're meant to be compared between runs.
+The simulator doesn't record the outputs here, so its own bookkeeping
+isn't counted.
+
+With ``--compare``, the run fails if any benchmark got slower than the
+baseline by more than ``--tolerance``, allocates more than it did or holds
+on to more blocks than it did.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from solsim import Simulator  # noqa: E402
+
+# Installs the hardware stand-ins, the firmware is imported after this. The
+# outputs aren't recorded, so the simulator's own allocations don't count.
+sim = Simulator([], record=False)
+
+import rplktrlib  # noqa: E402
+import winterbloom_smolmidi as smolmidi  # noqa: E402
+import winterbloom_voltageio as voltageio  # noqa: E402
+from winterbloom_sol import ADSR, ClockTracker, SawtoothLFO, SineLFO  # noqa: E402
+from winterbloom_sol import SlewLimiter  # noqa: E402
+from winterbloom_sol import TriangleLFO  # noqa: E402
+from winterbloom_sol import _midi_ext, sol  # noqa: E402
+
+_STEP_US = 1000
+_ALLOC_BATCH = 100
+
+BENCHMARKS = []
+
+
+def benchmark(ops):
+    """Registers a benchmark. The decorated function sets up the workload
+    and returns a function that performs one operation."""
+
+    def register(setup):
+        BENCHMARKS.append((setup.__name__, ops, setup))
+        return setup
+
+    return register
+
+
+def _cycle(items):
+    """Like itertools.cycle, but done allocating by the time it's returned."""
+    items = list(items)
+    cycle = itertools.cycle(items)
+    # The cycle keeps a copy of the items as it goes through them once.
+    for _ in items:
+        next(cycle)
+    return cycle
+
+
+class LoopingPort:
+    """A MIDI port that plays the same bytes over and over, without ever
+    running dry."""
+
+    def __init__(self, data):
+        self._data = data * (256 // len(data) + 2)
+        self._length = len(data)
+        self._pos = 0
+
+    def readinto(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        pos = self._pos
+        buf[:nbytes] = self._data[pos : pos + nbytes]
+        self._pos = (pos + nbytes) % self._length
+        return nbytes
+
+
+def _note_and_aftertouch():
+    """Notes with a burst of aftertouch and mod wheel, like a played chord."""
+    data = bytearray()
+    for note in (48, 55, 60):
+        data += bytes((smolmidi.NOTE_ON, note, 100))
+    for value in range(0, 128, 8):
+        data += bytes((smolmidi.AFTERTOUCH, 60, value))
+        data += bytes((smolmidi.CC, 1, value))
+    for note in (48, 55, 60):
+        data += bytes((smolmidi.NOTE_OFF, note, 0))
+    return bytes(data)
+
+
+@benchmark(ops=60000)
+def midi_in_receive():
+    midi_in = smolmidi.MidiIn(LoopingPort(_note_and_aftertouch()))
+    message = smolmidi.Message()
+    return lambda: midi_in.receive(message)
+
+
+@benchmark(ops=60000)
+def buffered_midi_in_receive():
+    midi_in = smolmidi.BufferedMidiIn(LoopingPort(_note_and_aftertouch()))
+    message = smolmidi.Message()
+    return lambda: midi_in.receive(message)
+
+
+@benchmark(ops=60000)
+def deduplicating_midi_in_receive():
+    midi_in = _midi_ext.DeduplicatingMidiIn(
+        smolmidi.BufferedMidiIn(LoopingPort(_note_and_aftertouch()))
+    )
+    return midi_in.receive
+
+
+@benchmark(ops=60000)
+def state_note_on_off():
+    state = sol.State()
+    # Hold four notes, then release them in the same order.
+    notes = (60, 64, 67, 72)
+    calls = _cycle(
+        [(state.note_on, note) for note in notes]
+        + [(state.note_off, note) for note in notes]
+    )
+
+    def op():
+        function, note = next(calls)
+        function(note)
+
+    return op
+
+
+@benchmark(ops=60000)
+def state_note_priority():
+    state = sol.State()
+    for note in (48, 52, 55, 60, 64, 67, 72, 76):
+        state.note_on(note)
+    return lambda: (state.highest_note, state.lowest_note, state.latest_note)
+
+
+@benchmark(ops=60000)
+def voltage_out_calibrated_value():
+    voltage_out = voltageio.VoltageOut(sys.modules["analogio"].AnalogOut(None))
+    voltage_out.direct_calibration(
+        {-5.0: 0, -2.0: 15100, 0.0: 25200, 2.0: 35300, 5.0: 50400, 8.0: 65535}
+    )
+    voltages = _cycle([n / 10.0 - 5.0 for n in range(131)])
+
+    def op():
+        return voltage_out._calibrated_value_for_voltage(next(voltages))
+
+    return op
+
+
+def _voltages():
+    return _cycle([n / 10.0 - 5.0 for n in range(131)])
+
+
+@benchmark(ops=60000)
+def outputs_cv_property():
+    outputs = sim.sol().outputs
+    voltages = _voltages()
+
+    def op():
+        outputs.cv_a = next(voltages)
+
+    return op
+
+
+@benchmark(ops=60000)
+def outputs_set_cv():
+    outputs = sim.sol().outputs
+    voltages = _voltages()
+    return lambda: outputs.set_cv("a", next(voltages))
+
+
+@benchmark(ops=60000)
+def outputs_set_gate():
+    outputs = sim.sol().outputs
+    values = _cycle([True, False])
+    return lambda: outputs.set_gate(1, next(values))
+
+
+@benchmark(ops=60000)
+def outputs_set_cv_index():
+    outputs = sim.sol().outputs
+    voltages = _voltages()
+    return lambda: outputs.set_cv_index(0, next(voltages))
+
+
+@benchmark(ops=60000)
+def outputs_set_cvs():
+    outputs = sim.sol().outputs
+    # One frame of four voltages per operation.
+    frames = _cycle(
+        [(n / 10.0 - 5.0, 5.0 - n / 10.0, n / 20.0, 0.0) for n in range(131)]
+    )
+    return lambda: outputs.set_cvs(next(frames))
+
+
+@benchmark(ops=60000)
+def outputs_step():
+    outputs = sim.sol().outputs
+    # A trigger every 100 steps, idle in between.
+    triggers = _cycle([outputs.trigger_gate_1] + [None] * 99)
+    clock = sim.clock
+
+    def op():
+        clock.advance(_STEP_US)
+        trigger = next(triggers)
+        if trigger is not None:
+            trigger()
+        outputs.step()
+
+    return op
+
+
+@benchmark(ops=60000)
+def status_led_step():
+    led = sim.sol().outputs.led
+    # A message every step and a quarter note pulse every 24, like MIDI
+    # clock with a busy mod wheel.
+    changes = _cycle([led.pulse] + [led.spin] * 23)
+    clock = sim.clock
+
+    def op():
+        clock.advance(_STEP_US)
+        next(changes)()
+        led.step()
+
+    return op
+
+
+@benchmark(ops=60000)
+def clock_tracker_phase():
+    tracker = ClockTracker()
+    tracker.start()
+    # MIDI clock at 125 BPM (a tick every 20 ms) with up to 1 ms of jitter,
+    # and the phase read every step in between.
+    jitter = _cycle([0, 700, 200, 900, 400, 100, 800, 300])
+    ticks = _cycle([True] + [False] * 19)
+    clock = sim.clock
+
+    def op():
+        clock.advance(_STEP_US)
+        if next(ticks):
+            tracker.tick(smolmidi.ticks_add(smolmidi.ticks_us(), next(jitter)))
+        return tracker.phase(0.25)
+
+    return op
+
+
+def _advancing(output):
+    """Reads ``output`` after moving the virtual clock forward."""
+    clock = sim.clock
+
+    def op():
+        clock.advance(_STEP_US)
+        return output()
+
+    return op
+
+
+@benchmark(ops=60000)
+def adsr_output():
+    adsr = ADSR(attack=0.05, decay=0.1, sustain=0.6, release=0.2)
+    # Gate on for 300 ms and off for 300 ms, covering every stage.
+    gate = _cycle([adsr.start] + [None] * 299 + [adsr.stop] + [None] * 299)
+
+    def output():
+        change = next(gate)
+        if change is not None:
+            change()
+        return adsr.output
+
+    return _advancing(output)
+
+
+@benchmark(ops=60000)
+def sine_lfo_output():
+    lfo = SineLFO(2.0)
+    return _advancing(lambda: lfo.output)
+
+
+@benchmark(ops=60000)
+def triangle_lfo_output():
+    lfo = TriangleLFO(2.0)
+    return _advancing(lambda: lfo.output)
+
+
+@benchmark(ops=60000)
+def sawtooth_lfo_output():
+    lfo = SawtoothLFO(2.0)
+    return _advancing(lambda: lfo.output)
+
+
+@benchmark(ops=60000)
+def slew_limiter_output():
+    slew = SlewLimiter(0.1)
+    # A new target every 250 ms.
+    targets = _cycle([target - 2.0 for target in range(5) for _ in range(250)])
+    changes = _cycle([True] + [False] * 249)
+
+    def output():
+        target = next(targets)
+        if next(changes):
+            slew.target = target
+        return slew.output
+
+    return _advancing(output)
+
+
+@benchmark(ops=20000)
+def red_blue_update():
+    outputs = sim.sol().outputs
+    state = sol.State()
+    red_blue = rplktrlib.RedBlue()
+    # A note on or off every 50 ms, nothing in between, like Sol.run.
+    steps = []
+    for note in (48, 55, 60, 55):
+        for message_type, function in (
+            (smolmidi.NOTE_ON, state.note_on),
+            (smolmidi.NOTE_OFF, state.note_off),
+        ):
+            message = smolmidi.Message()
+            message.type = message_type
+            message.channel = 0
+            message._set_data(2, note, 100 if message_type == smolmidi.NOTE_ON else 0)
+            steps.append((message, function, note))
+            steps.extend([(None, None, None)] * 49)
+    steps = _cycle(steps)
+
+    def op():
+        message, function, note = next(steps)
+        if function is not None:
+            function(note)
+        red_blue.update(state, message, outputs)
+        outputs.step()
+
+    return _advancing(op)
+
+
+def run_benchmark(name, ops, setup, repeat):
+    best = None
+    for _ in range(repeat):
+        op = setup()
+        start = time.perf_counter()
+        for _ in range(ops):
+            op()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # Allocations are measured separately, tracemalloc slows everything down.
+    op = setup()
+    for _ in range(_ALLOC_BATCH):
+        op()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(_ALLOC_BATCH):
+        op()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    return {
+        "ops": ops,
+        "seconds": best,
+        "ops_per_sec": ops / best,
+        "alloc_peak_bytes": peak - baseline,
+        "alloc_blocks_net": _net_blocks(before, after),
+    }
+
+
+def _net_blocks(before, after):
+    """Returns how many more memory blocks are held in ``after`` than in
+    ``before``, leaving out the harness's own: the snapshots and the numbers
+    run_benchmark keeps while measuring."""
+    code = run_benchmark.__code__
+    harness = set(line for _, _, line in code.co_lines() if line is not None)
+    blocks = 0
+    for stat in after.compare_to(before, "lineno"):
+        frame = stat.traceback[0]
+        if frame.filename == tracemalloc.__file__:
+            continue
+        if frame.filename == code.co_filename and frame.lineno in harness:
+            continue
+        blocks += stat.count_diff
+    return blocks
+
+
+def compare(results, baseline, tolerance):
+    """Returns a description of every regression against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(
+                "{}: {:.0f} ops/s, was {:.0f}".format(
+                    name, result["ops_per_sec"], before["ops_per_sec"]
+                )
+            )
+        if result["alloc_peak_bytes"] > before["alloc_peak_bytes"]:
+            regressions.append(
+                "{}: allocates {} bytes, was {}".format(
+                    name, result["alloc_peak_bytes"], before["alloc_peak_bytes"]
+                )
+            )
+        if result["alloc_blocks_net"] > before["alloc_blocks_net"]:
+            regressions.append(
+                "{}: holds on to {} blocks, was {}".format(
+                    name, result["alloc_blocks_net"], before["alloc_blocks_net"]
+                )
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="a previous report to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="how much slower than the baseline is still fine (default: 0.25)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("names", nargs="*", help="only run these benchmarks")
+    args = parser.parse_args()
+
+    results = {}
+    print(
+        "{:<32} {:>12} {:>12} {:>10}".format(
+            "benchmark", "ops/s", "peak bytes", "blocks"
+        )
+    )
+    for name, ops, setup in BENCHMARKS:
+        if args.names and name not in args.names:
+            continue
+        result = results[name] = run_benchmark(name, ops, setup, args.repeat)
+        print(
+            "{:<32} {:>12.0f} {:>12} {:>10}".format(
+                name,
+                result["ops_per_sec"],
+                result["alloc_peak_bytes"],
+                result["alloc_blocks_net"],
+            )
+        )
+
+    report = {
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
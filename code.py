@@ -12,7 +12,9 @@ print(f"{supervisor.runtime.autoreload=}")
 
 
 rb = RedBlue()
+s = sol.Sol()
+rb.configure_midi(s.midi_in)
 try:
-    sol.run(rb.update)
+    s.run(rb.update)
 except ValueError:
     reload()
@@ -1,7 +1,7 @@
 import micropython
-from winterbloom_smolmidi import NOTE_ON, NOTE_OFF, CC
+from winterbloom_smolmidi import NOTE_ON, NOTE_OFF, CC, PROGRAM_CHANGE, CHANNEL_PRESSURE
 from winterbloom_sol.helpers import note_to_volts_per_octave, offset_for_pitch_bend
-from winterbloom_sol import SlewLimiter
+from winterbloom_sol import SlewLimiter, eventlog
 
 from adafruit_ticks import ticks_ms, ticks_diff
 
@@ -14,6 +14,9 @@ UNISON = micropython.const(0)
 DUOPHONIC = micropython.const(1)
 ACCENT_VOLUME = micropython.const(92)
 REZ_TICKS_PER_100MSEC = micropython.const(14)
+# controllers read by `update()`, the MIDI parser drops all others
+CONTROLLERS = (1, 4, 11, 64, 65, 120, 123)
+CALLBACK_CALLS = eventlog.event("{} callback calls")
 
 counter = 0
 last_out = ticks_ms()
@@ -24,6 +27,18 @@ class RedBlue:
     def __init__(self):
         self.reset(UNISON)
     
+    def configure_midi(self, midi_in):
+        # only notes on channels 1 and 2 select a mode, controllers, pitch
+        # bend and aftertouch are read from any channel
+        for channel in range(2, 16):
+            midi_in.ignore(NOTE_ON, channel=channel)
+            midi_in.ignore(NOTE_OFF, channel=channel)
+        midi_in.ignore(PROGRAM_CHANGE)
+        midi_in.ignore(CHANNEL_PRESSURE)
+        for controller in range(128):
+            if controller not in CONTROLLERS:
+                midi_in.ignore(controller=controller)
+
     def reset(self, mode):
         self.voct = [None, None]
         self.gates = [False, False]
@@ -36,6 +51,18 @@ class RedBlue:
         self.is_accent = [False, False]
         self.current_band = 0
         self.band_direction = +1
+        self.resonance = 0.0
+
+    @property
+    def active(self):
+        # gate 4 pulses while there's resonance, and glides move the CV
+        if self.resonance:
+            return True
+        for n in VOICES:
+            assign = self.voct[n]
+            if assign.__class__ is SlewLimiter and assign.active:
+                return True
+        return False
 
     @micropython.native
     def update(self, state, msg, outputs):
@@ -135,7 +162,7 @@ class RedBlue:
         else:
             outputs.gate_2 = False
 
-        if any(self.triggers):
+        if self.triggers[RED] or self.triggers[BLUE]:
             outputs._gate_3_retrigger.retrigger()
         elif note_red or note_blue:
             outputs.gate_3 = True
@@ -144,6 +171,7 @@ class RedBlue:
 
         common_cutoff_base = state.cc(4) + state.cc(11)
         common_rez_base = state.cc(1)
+        self.resonance = common_rez_base
         self.cutoff[RED] += common_cutoff_base + (0.25 if self.is_accent[RED] else 0.0)
         self.cutoff[BLUE] += common_cutoff_base + (0.25 if self.is_accent[BLUE] else 0.0)
         # No support for duophonic resonance at this point.
@@ -170,7 +198,7 @@ class RedBlue:
             rez_ticks = 0
         if ticks_diff(now, last_out) > 1000:
             last_out = now
-            print(f"{counter} callback calls")
+            eventlog.write(CALLBACK_CALLS, counter)
             counter = 0
     
     @micropython.native
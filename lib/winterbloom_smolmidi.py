@@ -25,6 +25,9 @@ __repo__ = "https://github.com/theacodes/Winterbloom_SmolMIDI.git"
 
 """A minimalist MIDI library."""
 
+import array
+import time
+
 # Message type constants.
 NOTE_OFF = 0x80
 NOTE_ON = 0x90
@@ -69,11 +72,97 @@ def _is_channel_message(status_byte):
     return status_byte >= NOTE_OFF and status_byte <= PITCH_BEND + 0x0F
 
 
-def _read_n_bytes(port, buf, dest, num_bytes):
-    while num_bytes:
+# Entries in _STATUS_TABLE: the low two bits are the number of data bytes,
+# _CHANNEL_MESSAGE is set if the low nibble of the status byte is a channel.
+_DATA_LENGTH = 0x03
+_CHANNEL_MESSAGE = 0x04
+
+
+def _build_status_table():
+    table = bytearray(256)
+    for status_byte in range(0x80, 0x100):
+        if _is_channel_message(status_byte):
+            message_type = status_byte & 0xF0
+            info = _CHANNEL_MESSAGE
+        else:
+            message_type = status_byte
+            info = 0
+
+        if message_type in _LEN_2_MESSAGES:
+            info |= 2
+        elif message_type in _LEN_1_MESSAGES:
+            info |= 1
+
+        table[status_byte] = info
+    return bytes(table)
+
+
+# Everything the parsers need to know about a status byte, in one lookup.
+_STATUS_TABLE = _build_status_table()
+
+
+# Message timestamps are in microseconds and wrap around like MicroPython's
+# time.ticks_us, so they always fit in a small int.
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+try:
+    from time import ticks_us
+except ImportError:
+    try:
+        import supervisor
+    except ImportError:
+        supervisor = None
+
+    def ticks_us():
+        """Returns the current time in microseconds, for comparing with
+        Message.timestamp.
+
+        CircuitPython has no time.ticks_us, and time.monotonic_ns returns a
+        long int that has to be allocated, so this counts supervisor.ticks_ms
+        in microseconds instead. Its resolution is 1 ms.
+        """
+        if supervisor is None:
+            # CPython, where allocating doesn't matter.
+            return (time.monotonic_ns() // 1000) & _TICKS_MAX
+        ms = supervisor.ticks_ms()
+        # ms * 1000 would be a long int after 18 minutes, so it's worked out
+        # modulo _TICKS_PERIOD in two parts that each stay a small int.
+        low = (ms & 0x7FFFF) * 1000
+        high = (((ms >> 19) * 1000) & 0x7FF) << 19
+        return (low - (_TICKS_MAX - high) - 1) & _TICKS_MAX
+
+
+# MicroPython allocates ints of _TICKS_PERIOD or more, so the functions
+# below never add two timestamps, or a timestamp and a positive delta,
+# together. Subtracting _TICKS_MAX and then 1 is adding _TICKS_PERIOD, which
+# the mask takes away again.
+
+
+def ticks_diff(end, start):
+    """Returns the microseconds between two timestamps from ticks_us,
+    accounting for wrap around."""
+    diff = (end - start) & _TICKS_MAX
+    if diff >= _TICKS_HALFPERIOD:
+        return diff - _TICKS_MAX - 1
+    return diff
+
+
+def ticks_add(ticks, delta):
+    """Offsets a timestamp from ticks_us by ``delta`` microseconds,
+    accounting for wrap around. ``delta`` must be less than half the
+    ticks period either way."""
+    if delta < 0:
+        return (ticks + delta) & _TICKS_MAX
+    return (ticks - (_TICKS_MAX - delta) - 1) & _TICKS_MAX
+
+
+def _read_n_bytes(port, buf, dest, start, end):
+    while start < end:
         if port.readinto(buf, 1):
-            dest.append(buf[0])
-            num_bytes -= 1
+            dest[start] = buf[0]
+            start += 1
 
 
 class Message:
@@ -81,35 +170,149 @@ class Message:
         self.type = None
         self.channel = None
         self.data = None
+        # When the message was read from the port, from ticks_us.
+        self.timestamp = 0
+        # Fixed storage for the data bytes, so parsing into an existing
+        # message doesn't allocate. ``data`` points to one of these.
+        self._data = bytearray(2)
+        self._data_1 = memoryview(self._data)[:1]
+
+    def _set_data(self, length, data_0, data_1):
+        if length == 2:
+            self._data[0] = data_0
+            self._data[1] = data_1
+            self.data = self._data
+        elif length == 1:
+            self._data[0] = data_0
+            self.data = self._data_1
+        else:
+            self.data = None
 
     def __bytes__(self):
         status_byte = self.type
         if self.channel:
             status_byte |= self.channel
 
-        return bytes([status_byte] + list(self.data if self.data else []))
+        data = self.data
+        if not data:
+            return bytes((status_byte,))
+        if len(data) == 1:
+            return bytes((status_byte, data[0]))
+        return bytes((status_byte, data[0], data[1]))
 
     def copy_from(self, other):
         self.type = other.type
         self.channel = other.channel
-        self.data = other.data
+        self.timestamp = other.timestamp
+        data = other.data
+        if not data:
+            self.data = None
+        elif len(data) == 1:
+            self._set_data(1, data[0], 0)
+        else:
+            self._set_data(2, data[0], data[1])
         return self
 
 
+class MessagePool:
+    """A fixed set of preallocated messages that are handed out in turn.
+
+    Parsers take messages from a pool instead of creating new ones, so
+    receiving doesn't allocate. A message taken from the pool is recycled
+    after ``size - 1`` more messages have been taken, so don't hold on to
+    messages for longer than that. Use ``Message.copy_from`` to keep one
+    around.
+    """
+
+    def __init__(self, size=4):
+        self._messages = [Message() for _ in range(size)]
+        self._index = 0
+
+    def peek(self):
+        """Returns the message that take will hand out next, without
+        taking it."""
+        return self._messages[self._index]
+
+    def take(self):
+        message = self._messages[self._index]
+        self._index += 1
+        if self._index == len(self._messages):
+            self._index = 0
+        return message
+
+
 class MidiIn:
-    def __init__(self, port, enable_running_status=False):
+    def __init__(self, port, enable_running_status=False, pool=None):
         self._port = port
         self._read_buf = bytearray(3)
         self._running_status_enabled = enable_running_status
         self._running_status = None
         self._outstanding_sysex = False
         self._error_count = 0
+        # Filters: whether messages with each status byte are accepted, and
+        # a bitmap of the accepted controller numbers for control changes.
+        self._status_filter = bytearray(b"\x01" * 256)
+        self._controller_filter = bytearray(b"\xff" * 16)
+        self._pool = pool or MessagePool()
 
     @property
     def error_count(self):
         return self._error_count
 
+    def ignore(self, message_type=None, channel=None, controller=None):
+        """Drops matching messages as soon as they're parsed, so they never
+        make it into a Message.
+
+        Any combination of arguments can be given, for example::
+
+            midi_in.ignore(ACTIVE_SENSING)
+            midi_in.ignore(channel=9)
+            midi_in.ignore(PROGRAM_CHANGE, channel=0)
+            midi_in.ignore(CC, controller=7)
+
+        ``channel`` only matches channel messages. ``controller`` applies to
+        control change messages on every channel.
+        """
+        self._set_filter(message_type, channel, controller, False)
+
+    def accept(self, message_type=None, channel=None, controller=None):
+        """Undoes ignore for matching messages, takes the same arguments."""
+        self._set_filter(message_type, channel, controller, True)
+
+    def _set_filter(self, message_type, channel, controller, accept):
+        if controller is not None:
+            if message_type not in (None, CC) or channel is not None:
+                raise ValueError("controller filters apply to CC on all channels")
+            if accept:
+                self._controller_filter[controller >> 3] |= 1 << (controller & 7)
+            else:
+                self._controller_filter[controller >> 3] &= ~(1 << (controller & 7))
+            return
+
+        for status_byte in range(0x80, 0x100):
+            if _STATUS_TABLE[status_byte] & _CHANNEL_MESSAGE:
+                if message_type is not None and status_byte & 0xF0 != message_type:
+                    continue
+                if channel is not None and status_byte & 0x0F != channel:
+                    continue
+            elif channel is not None or message_type not in (None, status_byte):
+                continue
+            self._status_filter[status_byte] = accept
+
+    def _accepts(self, status_byte, data_0):
+        if not self._status_filter[status_byte]:
+            return False
+        if status_byte & 0xF0 == CC:
+            return self._controller_filter[data_0 >> 3] & (1 << (data_0 & 7))
+        return True
+
     def receive(self, into=None):
+        """Returns the next message, or None if there isn't one.
+
+        The message is parsed into ``into`` if it's given. Otherwise it's
+        taken from ``pool`` (a MessagePool), so it's only valid until the
+        pool recycles it. Neither allocates.
+        """
         # Before we do anything, check and see if there's an unprocessed
         # sysex message pending. If so, throw it away. The caller has
         # to call receive_sysex if they care about the bytes.
@@ -123,8 +326,12 @@ class MidiIn:
         if not result:
             return None
 
-        message = into or Message()
-        data_bytes = bytearray()
+        # Only take the pool's message once it's returned, so dropped
+        # messages don't use up the pool.
+        message = into or self._pool.peek()
+        message.timestamp = ticks_us()
+        data_bytes = message._data
+        length = 0
 
         # Is this a status byte?
         status_byte = self._read_buf[0]
@@ -133,7 +340,8 @@ class MidiIn:
         # If not, see if we have a running status byte.
         if not is_status:
             if self._running_status_enabled and self._running_status:
-                data_bytes = [status_byte]
+                data_bytes[0] = status_byte
+                length = 1
                 status_byte = self._running_status
             # If not a status byte and no running status, this is
             # invalid data.
@@ -141,9 +349,11 @@ class MidiIn:
                 self._error_count += 1
                 return None
 
+        info = _STATUS_TABLE[status_byte]
+
         # Is this a channel message, if so, let's figure out the right
         # message type and set the message's channel property.
-        if _is_channel_message(status_byte):
+        if info & _CHANNEL_MESSAGE:
             # Only set the running status byte for channel messages.
             self._running_status = status_byte
             # Mask off the channel nibble.
@@ -154,12 +364,15 @@ class MidiIn:
             message.channel = None
 
         # Read the appropriate number of bytes for each message type.
-        if message.type in _LEN_2_MESSAGES:
-            _read_n_bytes(self._port, self._read_buf, data_bytes, 2 - len(data_bytes))
-            message.data = data_bytes
-        elif message.type in _LEN_1_MESSAGES:
-            _read_n_bytes(self._port, self._read_buf, data_bytes, 1 - len(data_bytes))
+        data_length = info & _DATA_LENGTH
+        if data_length == 2:
+            _read_n_bytes(self._port, self._read_buf, data_bytes, length, 2)
             message.data = data_bytes
+        elif data_length == 1:
+            _read_n_bytes(self._port, self._read_buf, data_bytes, length, 1)
+            message.data = message._data_1
+        else:
+            message.data = None
 
         # If this is a sysex message, set the pending sysex flag so we
         # can throw the message away if the user doesn't process it.
@@ -170,13 +383,24 @@ class MidiIn:
         # embedded, it probably means the buffer overflowed. Either way, discard the
         # message.
         # TODO: Figure out a better way to detect and deal with this upstream.
-        for b in data_bytes:
+        for b in message.data or ():
             if b & 0x80:
                 self._error_count += 1
                 return None
 
+        if not self._accepts(status_byte, data_bytes[0]):
+            return None
+
+        if into is None:
+            self._pool.take()
         return message
 
+    def receive_realtime(self, into=None):
+        """Returns the next real-time message if the parser keeps them apart
+        from the rest of the stream. MidiIn doesn't, so this always returns
+        None and real-time messages come from receive."""
+        return None
+
     def receive_sysex(self, max_length):
         """Receives the next outstanding sysex message.
 
@@ -214,3 +438,443 @@ class MidiIn:
                 self._port.readinto(buf, 1)
 
         return out, truncated
+
+    def receive_sysex_into(self, buf, on_chunk=None):
+        """Receives the next outstanding sysex message into ``buf``.
+
+        ``buf`` can be any writable buffer, such as a bytearray or a
+        memoryview. If ``on_chunk`` is given, it's called as
+        ``on_chunk(buf, length)`` every time ``buf`` fills up and once more
+        with whatever is left at the end of the message, so messages of
+        any size can be streamed through a small buffer. Without it, bytes
+        that don't fit in ``buf`` are thrown away.
+
+        Returns a tuple: the number of bytes written to ``buf`` (across all
+        chunks) and a boolean that indicates if the message was truncated.
+
+        Like receive_sysex, this must be called right after getting a
+        sysex message from receive.
+        """
+        self._outstanding_sysex = False
+
+        read_buf = self._read_buf
+        size = len(buf)
+        length = 0
+        count = 0
+        truncated = False
+
+        while True:
+            if not self._port.readinto(read_buf, 1):
+                continue
+            byte = read_buf[0]
+            if byte == SYSEX_END:
+                break
+            if length == size:
+                if on_chunk is None:
+                    truncated = True
+                    continue
+                on_chunk(buf, length)
+                length = 0
+            buf[length] = byte
+            length += 1
+            count += 1
+
+        if on_chunk is not None and length:
+            on_chunk(buf, length)
+
+        return count, truncated
+
+
+class BufferedMidiIn(MidiIn):
+    """Like MidiIn, but reads everything the port has available in one go.
+
+    MidiIn calls ``readinto`` once per byte, so every three byte message
+    costs three reads from the port. BufferedMidiIn drains all of the
+    bytes that are available with a single ``readinto`` into a preallocated
+    ring buffer and decodes messages from there with a byte-level state
+    machine. Partially received messages are kept in the parser's state
+    until the rest of their bytes arrive, so messages split across USB
+    packets are handled correctly.
+
+    Example::
+
+        midi_in = BufferedMidiIn(usb_midi.ports[0])
+
+        while True:
+            msg = midi_in.receive()
+
+    ``buffer_size`` must be a power of two. ``read_size`` is the most that
+    will be read from the port at once, the port is only read when there's
+    at least that much room left in the ring buffer.
+
+    When ``receive`` is called without ``into``, the message is taken from
+    ``pool`` (a MessagePool), so it's only valid until the pool recycles it.
+
+    Every byte is stamped with ticks_us when it's read from the port, and
+    a message's timestamp is the time its last byte was read.
+
+    ``port`` can also be a ``busio.UART`` for a DIN MIDI input, set up with
+    ``baudrate=31250`` and ``timeout=0`` so reading it never blocks. Its
+    ``in_waiting`` is checked before reading it.
+
+    Real-time messages (clock, start, stop, etc.) are taken out of the
+    stream as soon as they're read from the port, even from the middle of
+    another message, and go into a separate queue. ``receive`` returns them
+    before anything else and ``receive_realtime`` returns only them.
+
+    Messages dropped with ``ignore`` cost a table lookup: ignored real-time
+    messages never make it into the queue and other messages are dropped
+    once their last byte is parsed, without touching a Message.
+    """
+
+    def __init__(
+        self,
+        port,
+        enable_running_status=False,
+        buffer_size=256,
+        read_size=64,
+        pool=None,
+    ):
+        if buffer_size & (buffer_size - 1) or read_size >= buffer_size:
+            raise ValueError("buffer_size must be a power of two above read_size")
+
+        super().__init__(port, enable_running_status=enable_running_status, pool=pool)
+        self._ring = bytearray(buffer_size)
+        self._stamps = array.array("l", [0] * buffer_size)
+        self._mask = buffer_size - 1
+        self._head = 0
+        self._tail = 0
+        self._scratch = bytearray(read_size)
+        # Serial ports say how much is waiting, which is cheaper to check
+        # than an empty read. USB MIDI ports don't.
+        self._has_in_waiting = hasattr(port, "in_waiting")
+        # A read can be all real-time messages, so the queue is as big as a
+        # read and the port is only read once the queue is empty.
+        self._realtime = bytearray(read_size)
+        self._realtime_stamps = array.array("l", [0] * read_size)
+        self._realtime_head = 0
+        self._realtime_count = 0
+        # Parser state: the status byte of the message being received (0 if
+        # there isn't one), how many data bytes it needs and how many we have.
+        self._status = 0
+        self._expected = 0
+        self._count = 0
+        self._data_0 = 0
+        self._in_sysex = False
+
+    def _fill(self):
+        # Leave the data in the port while there are real-time messages
+        # left to hand out, so the real-time queue can't overflow.
+        if not self._realtime_count:
+            self._read()
+
+    def _read(self):
+        scratch = self._scratch
+        mask = self._mask
+        tail = self._tail
+
+        # Leave the data in the port if the ring buffer can't hold a full read.
+        if (self._head - tail - 1) & mask < len(scratch):
+            return
+
+        if self._has_in_waiting and not self._port.in_waiting:
+            return
+
+        # A serial port returns None rather than 0 when there's nothing to read.
+        count = self._port.readinto(scratch)
+        if not count:
+            return
+
+        now = ticks_us()
+        ring = self._ring
+        stamps = self._stamps
+        status_filter = self._status_filter
+        for n in range(count):
+            byte = scratch[n]
+            if byte >= CLOCK:
+                if status_filter[byte]:
+                    self._push_realtime(byte, now)
+                continue
+            ring[tail] = byte
+            stamps[tail] = now
+            tail = (tail + 1) & mask
+        self._tail = tail
+
+    def _push_realtime(self, status_byte, timestamp):
+        realtime = self._realtime
+        # Only possible while receiving sysex, which has to keep reading.
+        if self._realtime_count == len(realtime):
+            self._error_count += 1
+            return
+        index = (self._realtime_head + self._realtime_count) % len(realtime)
+        realtime[index] = status_byte
+        self._realtime_stamps[index] = timestamp
+        self._realtime_count += 1
+
+    def receive_realtime(self, into=None):
+        self._fill()
+
+        if not self._realtime_count:
+            return None
+
+        head = self._realtime_head
+        self._realtime_head = (head + 1) % len(self._realtime)
+        self._realtime_count -= 1
+        return self._build(
+            into, self._realtime[head], 0, 0, 0, self._realtime_stamps[head]
+        )
+
+    def receive(self, into=None):
+        self._fill()
+
+        if self._realtime_count:
+            return self.receive_realtime(into)
+
+        ring = self._ring
+        mask = self._mask
+        status_filter = self._status_filter
+        head = self._head
+        tail = self._tail
+
+        while head != tail:
+            byte = ring[head]
+            head = (head + 1) & mask
+
+            if byte & 0x80:
+                # Real-time messages never make it into the ring buffer, so
+                # any status byte ends an unfinished message or sysex.
+                if self._count:
+                    self._error_count += 1
+                in_sysex = self._in_sysex
+                self._in_sysex = False
+                self._count = 0
+
+                # Start collecting the data bytes for the message. System
+                # common messages use _status too, but clear the running
+                # status once they're complete.
+                data_length = _STATUS_TABLE[byte] & _DATA_LENGTH
+                if data_length:
+                    self._status = byte
+                    self._expected = data_length
+                    continue
+
+                self._status = 0
+
+                # If the caller doesn't call receive_sysex, or sysex is
+                # ignored, the data bytes are skipped until the end of the
+                # message.
+                if byte == SYSEX:
+                    self._in_sysex = True
+                    if not status_filter[byte]:
+                        continue
+                    self._outstanding_sysex = True
+                elif byte == SYSEX_END and in_sysex:
+                    self._outstanding_sysex = False
+                    continue
+                elif not status_filter[byte]:
+                    continue
+
+                self._head = head
+                timestamp = self._stamps[(head - 1) & mask]
+                return self._build(into, byte, 0, 0, 0, timestamp)
+
+            if self._in_sysex:
+                continue
+
+            # Data byte without a status byte, this is invalid data.
+            if not self._status:
+                self._error_count += 1
+                continue
+
+            if self._count == 0 and self._expected == 2:
+                self._data_0 = byte
+                self._count = 1
+                continue
+
+            status = self._status
+            self._count = 0
+            if not (
+                self._running_status_enabled
+                and _STATUS_TABLE[status] & _CHANNEL_MESSAGE
+            ):
+                self._status = 0
+
+            # Ignored messages are dropped here, before they're built.
+            if not status_filter[status]:
+                continue
+            if status & 0xF0 == CC and not (
+                self._controller_filter[self._data_0 >> 3] & (1 << (self._data_0 & 7))
+            ):
+                continue
+
+            self._head = head
+            timestamp = self._stamps[(head - 1) & mask]
+            if self._expected == 2:
+                return self._build(into, status, self._data_0, byte, 2, timestamp)
+            return self._build(into, status, byte, 0, 1, timestamp)
+
+        self._head = head
+        return None
+
+    def _build(self, into, status_byte, data_0, data_1, length, timestamp):
+        message = into or self._pool.take()
+
+        if _STATUS_TABLE[status_byte] & _CHANNEL_MESSAGE:
+            message.type = status_byte & 0xF0
+            message.channel = status_byte & 0x0F
+        else:
+            message.type = status_byte
+            message.channel = None
+
+        message._set_data(length, data_0, data_1)
+        message.timestamp = timestamp
+        return message
+
+    def receive_sysex(self, max_length):
+        """Receives the next outstanding sysex message.
+
+        Works the same way as MidiIn.receive_sysex, but reads from the
+        ring buffer instead of one byte at a time from the port. Use
+        receive_sysex_into to avoid allocating the returned bytearray.
+        """
+        out = bytearray(max_length)
+        length, truncated = self.receive_sysex_into(out)
+        del out[length:]
+        return out, truncated
+
+    def receive_sysex_into(self, buf, on_chunk=None):
+        """Receives the next outstanding sysex message into ``buf``.
+
+        Works the same way as MidiIn.receive_sysex_into, but copies
+        everything that's already in the ring buffer at once and refills it
+        with bulk reads from the port. A status byte other than SYSEX_END
+        also ends the message, as the MIDI spec allows, and is left for
+        receive to handle. Real-time messages that arrive during the sysex
+        message are queued as usual, any that don't fit in the queue are
+        dropped and counted in error_count.
+        """
+        self._outstanding_sysex = False
+        self._in_sysex = False
+
+        ring = self._ring
+        mask = self._mask
+        size = len(buf)
+        length = 0
+        count = 0
+        truncated = False
+
+        while True:
+            # Keep reading even if real-time messages are waiting, they
+            # can't be handed out until the sysex message is over.
+            self._read()
+            head = self._head
+            tail = self._tail
+            while head != tail:
+                byte = ring[head]
+                if byte & 0x80:
+                    break
+                head = (head + 1) & mask
+                if length == size:
+                    if on_chunk is None:
+                        truncated = True
+                        continue
+                    on_chunk(buf, length)
+                    length = 0
+                buf[length] = byte
+                length += 1
+                count += 1
+            self._head = head
+            if head != tail:
+                break
+
+        if ring[self._head] == SYSEX_END:
+            self._head = (self._head + 1) & mask
+
+        if on_chunk is not None and length:
+            on_chunk(buf, length)
+
+        return count, truncated
+
+
+class MidiOut:
+    """Sends MIDI messages to a port, batching them into a single write.
+
+    Messages are serialized into a preallocated buffer and are only written
+    to the port when ``flush`` is called, or when the buffer is full. Call
+    ``flush`` once per loop iteration::
+
+        midi_out = MidiOut(usb_midi.ports[1])
+
+        while True:
+            midi_out.write(CLOCK)
+            midi_out.write(NOTE_ON, channel=0, data_0=60, data_1=100)
+            midi_out.flush()
+
+    With running status enabled, the status byte of a channel message is
+    left out when it's the same as the previous one. That saves a third of
+    the bandwidth on a serial (DIN) port. USB MIDI sends every message as
+    its own fixed-size packet, so it doesn't benefit.
+    """
+
+    def __init__(self, port, buffer_size=64, enable_running_status=True):
+        self._port = port
+        self._buf = bytearray(buffer_size)
+        # A view of the start of the buffer for every possible length, so
+        # flush doesn't have to slice (and allocate).
+        view = memoryview(self._buf)
+        self._views = [view[:length] for length in range(buffer_size + 1)]
+        self._length = 0
+        self._running_status_enabled = enable_running_status
+        self._running_status = 0
+
+    def write(self, message_type, channel=0, data_0=0, data_1=0):
+        """Queues a message given its type, channel and data bytes."""
+        info = _STATUS_TABLE[message_type]
+        data_length = info & _DATA_LENGTH
+        if self._length + 1 + data_length > len(self._buf):
+            self.flush()
+
+        buf = self._buf
+        length = self._length
+
+        if info & _CHANNEL_MESSAGE:
+            status_byte = message_type | channel
+            if not (
+                self._running_status_enabled and status_byte == self._running_status
+            ):
+                buf[length] = status_byte
+                length += 1
+            self._running_status = status_byte
+        else:
+            buf[length] = message_type
+            length += 1
+            # Real-time messages can go anywhere without affecting running
+            # status, everything else clears it.
+            if message_type < CLOCK:
+                self._running_status = 0
+
+        if data_length:
+            buf[length] = data_0
+            length += 1
+        if data_length == 2:
+            buf[length] = data_1
+            length += 1
+
+        self._length = length
+
+    def send(self, message):
+        """Queues a Message, for example one received from MidiIn."""
+        data = message.data
+        if not data:
+            self.write(message.type, message.channel or 0)
+        elif len(data) == 1:
+            self.write(message.type, message.channel or 0, data[0])
+        else:
+            self.write(message.type, message.channel or 0, data[0], data[1])
+
+    def flush(self):
+        """Writes all of the queued messages to the port."""
+        if not self._length:
+            return
+        self._port.write(self._views[self._length])
+        self._length = 0
@@ -20,7 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from winterbloom_sol import eventlog
 from winterbloom_sol.adsr import ADSR
+from winterbloom_sol.clock_tracker import ClockTracker
 from winterbloom_sol.helpers import (
     map,
     note_to_volts_per_octave,
@@ -29,24 +31,54 @@ from winterbloom_sol.helpers import (
 )
 from winterbloom_sol.lfo import SawtoothLFO, SineLFO, TriangleLFO
 from winterbloom_sol.poly import Poly
+from winterbloom_sol.profiler import Profiler
 from winterbloom_sol.slew_limiter import SlewLimiter
 from winterbloom_sol.sol import Sol, State
-from winterbloom_sol.trigger import Retrigger, Trigger
+from winterbloom_sol.trigger import Retrigger, Trigger, TriggerScheduler
 
 
-def run(loop):
-    sol = Sol()
+def run(loop, profile=False):
+    sol = Sol(profile=profile)
     sol.run(loop)
 
 
+def run_idle(loop, watch=(), idle_ms=1, wake_ms=100):
+    sol = Sol()
+    sol.run_idle(loop, watch=watch, idle_ms=idle_ms, wake_ms=wake_ms)
+
+
+def run_async(loop, rate=1000, budget=32, trigger_rate=1000, led_rate=50):
+    sol = Sol()
+    sol.run_async(
+        loop, rate=rate, budget=budget, trigger_rate=trigger_rate, led_rate=led_rate
+    )
+
+
+def run_batched(loop, budget=32):
+    sol = Sol()
+    sol.run_batched(loop, budget=budget)
+
+
+def run_scheduled(loop, rate=1000, budget=32):
+    sol = Sol()
+    sol.run_scheduled(loop, rate=rate, budget=budget)
+
+
 __all__ = [
     "ADSR",
+    "ClockTracker",
+    "eventlog",
     "map",
     "note_to_volts_per_octave",
     "offset_for_pitch_bend",
     "Poly",
+    "Profiler",
     "Retrigger",
     "run",
+    "run_async",
+    "run_batched",
+    "run_idle",
+    "run_scheduled",
     "SawtoothLFO",
     "SineLFO",
     "SlewLimiter",
@@ -54,5 +86,6 @@ __all__ = [
     "State",
     "TriangleLFO",
     "Trigger",
+    "TriggerScheduler",
     "voct",
 ]
@@ -20,21 +20,44 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import array
+
+import micropython
 import winterbloom_smolmidi as smolmidi
+from winterbloom_sol import eventlog
 
 _DEBUG = False
-_DEDUPLICATE_MESSAGES = set(
-    [
-        smolmidi.CHANNEL_PRESSURE,
-        smolmidi.AFTERTOUCH,
-        smolmidi.CC,  # XXX this should check if it's the same CC
-        smolmidi.PITCH_BEND,
-        smolmidi.SONG_POSITION,
-    ]
-)
+_SKIPPED = eventlog.event("Skipped {} messages, error count: {}")
+
+# Messages that only carry the latest value of something are coalesced into
+# a slot per (type, channel, controller/note). These are the first slot
+# numbers for each kind of message. Pitch bend and song position, the
+# messages with two data bytes of value, are kept next to each other.
+_AFTERTOUCH_SLOTS = micropython.const(0)  # + channel * 128 + note
+_CC_SLOTS = micropython.const(2048)  # + channel * 128 + controller
+_PITCH_BEND_SLOTS = micropython.const(4096)  # + channel
+_SONG_POSITION_SLOT = micropython.const(4112)
+_CHANNEL_PRESSURE_SLOTS = micropython.const(4113)  # + channel
+_SLOT_COUNT = micropython.const(4129)
 
 
-MSG = smolmidi.Message()
+@micropython.native
+def _slot_for(message):
+    """Returns the coalescing slot for the message or -1 if it can't be
+    coalesced."""
+    msg_type = message.type
+    if msg_type == smolmidi.CC:
+        return _CC_SLOTS + (message.channel << 7) + message.data[0]
+    if msg_type == smolmidi.AFTERTOUCH:
+        return _AFTERTOUCH_SLOTS + (message.channel << 7) + message.data[0]
+    if msg_type == smolmidi.PITCH_BEND:
+        return _PITCH_BEND_SLOTS + message.channel
+    if msg_type == smolmidi.CHANNEL_PRESSURE:
+        return _CHANNEL_PRESSURE_SLOTS + message.channel
+    if msg_type == smolmidi.SONG_POSITION:
+        return _SONG_POSITION_SLOT
+    return -1
+
 
 class DeduplicatingMidiIn:
     """Like MidiIn, but can de-duplicate messages.
@@ -42,48 +65,247 @@ class DeduplicatingMidiIn:
     For example, if the buffer is filled with a lot of Channel Pressure
     messages and we only care about the most recent one, this can ignore
     all but the latest automatically.
+
+    Controller changes, aftertouch, channel pressure, pitch bend and song
+    position are stored in a slot per (type, channel, controller/note)
+    as they are read. Each slot that changed is then returned once, with
+    its latest value, so interleaved streams (say, the mod wheel, a foot
+    pedal and pitch bend all moving at once) are coalesced too. Any other
+    message is returned in order, after the slots that changed before it.
+
+    Real-time messages skip the queue: they're returned as soon as the
+    underlying MidiIn has them.
+
+    A coalesced message's timestamp is the time of the first change folded
+    into it, so it shows how long the oldest part of it has been waiting.
+
+    Messages are received into a small MessagePool, so the returned
+    message is only valid until the next call to receive.
     """
 
-    def __init__(self, midi_in):
+    def __init__(self, midi_in, queue_size=64, read_budget=64):
         self._midi_in = midi_in
+        # One message for the message being returned and one for the
+        # message returned last time.
+        self._pool = smolmidi.MessagePool(2)
+        # A message that can't be coalesced, held back until the slots
+        # that changed before it are returned.
+        self._held = smolmidi.Message()
         self._peeked = None
+        self._read_budget = read_budget
+        self._skipped = 0
+        # The latest data for each slot. For pitch bend and song position
+        # the first data byte goes into _values_lsb.
+        self._values = bytearray(_SLOT_COUNT)
+        self._values_lsb = bytearray(_CHANNEL_PRESSURE_SLOTS - _PITCH_BEND_SLOTS)
+        # One bit per slot, set while the slot is in the queue.
+        self._pending = bytearray((_SLOT_COUNT + 7) // 8)
+        self._queue = array.array("H", [0] * queue_size)
+        self._queue_stamps = array.array("l", [0] * queue_size)
+        self._queue_head = 0
+        self._queue_count = 0
+
+    @micropython.native
+    def _store(self, slot, message):
+        data = message.data
+        if slot >= _CHANNEL_PRESSURE_SLOTS:
+            self._values[slot] = data[0]
+        else:
+            if slot >= _PITCH_BEND_SLOTS:
+                self._values_lsb[slot - _PITCH_BEND_SLOTS] = data[0]
+            self._values[slot] = data[1]
+
+        bit = 1 << (slot & 7)
+        if self._pending[slot >> 3] & bit:
+            self._skipped += 1
+            return
+
+        self._pending[slot >> 3] |= bit
+        queue = self._queue
+        index = (self._queue_head + self._queue_count) % len(queue)
+        queue[index] = slot
+        self._queue_stamps[index] = message.timestamp
+        self._queue_count += 1
+
+    @micropython.native
+    def _pop(self):
+        queue = self._queue
+        slot = queue[self._queue_head]
+        message = self._pool.take()
+        message.timestamp = self._queue_stamps[self._queue_head]
+        self._queue_head = (self._queue_head + 1) % len(queue)
+        self._queue_count -= 1
+        self._pending[slot >> 3] &= ~(1 << (slot & 7))
+
+        value = self._values[slot]
+        if slot < _CC_SLOTS:
+            message.type = smolmidi.AFTERTOUCH
+            message.channel = slot >> 7
+            message._set_data(2, slot & 0x7F, value)
+        elif slot < _PITCH_BEND_SLOTS:
+            slot -= _CC_SLOTS
+            message.type = smolmidi.CC
+            message.channel = slot >> 7
+            message._set_data(2, slot & 0x7F, value)
+        elif slot < _SONG_POSITION_SLOT:
+            message.type = smolmidi.PITCH_BEND
+            message.channel = slot - _PITCH_BEND_SLOTS
+            message._set_data(2, self._values_lsb[slot - _PITCH_BEND_SLOTS], value)
+        elif slot == _SONG_POSITION_SLOT:
+            message.type = smolmidi.SONG_POSITION
+            message.channel = None
+            message._set_data(2, self._values_lsb[slot - _PITCH_BEND_SLOTS], value)
+        else:
+            message.type = smolmidi.CHANNEL_PRESSURE
+            message.channel = slot - _CHANNEL_PRESSURE_SLOTS
+            message._set_data(1, value, 0)
+        return message
+
+    def receive_realtime(self):
+        # Only take the pool's message once it's returned, like MidiIn.receive.
+        message = self._midi_in.receive_realtime(self._pool.peek())
+        if message is not None:
+            self._pool.take()
+        return message
 
     def receive(self):
+        message = self.receive_realtime()
+        if message is not None:
+            return message
+
+        if self._queue_count:
+            return self._pop()
+
         if self._peeked is not None:
             message = self._peeked
             self._peeked = None
-        else:
-            message = self._midi_in.receive(MSG)
-
-        if message is None:
-            return None
-
-        if message.type not in _DEDUPLICATE_MESSAGES:
             return message
 
-        # Peek ahead and see if there's another message of the same type.
-        count = 0
-        while True:
-            self._peeked = self._midi_in.receive()
+        queue_size = len(self._queue)
+        for _ in range(self._read_budget):
+            if self._queue_count == queue_size:
+                break
 
-            # If not, break.
-            if self._peeked is None:
+            # Stored and held messages are copied out of the pool's message,
+            # so it's only taken when it's returned.
+            message = self._midi_in.receive(self._pool.peek())
+            if message is None:
                 break
 
-            if self._peeked.type != message.type:
+            slot = _slot_for(message)
+            if slot < 0:
+                if not self._queue_count or message.type >= smolmidi.CLOCK:
+                    return self._pool.take()
+                self._peeked = self._held.copy_from(message)
                 break
 
-            message = self._peeked
-            count += 1
+            self._store(slot, message)
 
-        if _DEBUG and count:  # pragma: no cover
-            print(
-                "Skipped {} messages, error count: {}".format(
-                    count, self._midi_in.error_count
-                )
-            )
+        if _DEBUG and self._skipped:  # pragma: no cover
+            eventlog.write(_SKIPPED, self._skipped, self._midi_in.error_count)
+            self._skipped = 0
 
-        return message
+        if self._queue_count:
+            return self._pop()
+        return None
 
     def receive_sysex(self, *args, **kwargs):
         return self._midi_in.receive_sysex(*args, **kwargs)
+
+    def receive_sysex_into(self, *args, **kwargs):
+        return self._midi_in.receive_sysex_into(*args, **kwargs)
+
+    def ignore(self, *args, **kwargs):
+        self._midi_in.ignore(*args, **kwargs)
+
+    def accept(self, *args, **kwargs):
+        self._midi_in.accept(*args, **kwargs)
+
+
+class MergedMidiIn:
+    """Merges several MIDI inputs into a single stream.
+
+    Takes MIDI inputs (usually BufferedMidiIns, for example one for USB
+    and one for a ``busio.UART`` DIN input) and returns their messages in
+    the order they arrived in, going by each message's timestamp. Real-time
+    messages are merged the same way and still come first.
+
+    One message is received ahead from each input so the inputs can be
+    compared, an input that has nothing to read costs one call. Messages
+    are only valid until the next call to receive.
+    """
+
+    def __init__(self, midi_ins):
+        self._midi_ins = tuple(midi_ins)
+        count = len(self._midi_ins)
+        self._pending = tuple(smolmidi.Message() for _ in range(count))
+        self._ready = bytearray(count)
+        self._realtime_pending = tuple(smolmidi.Message() for _ in range(count))
+        self._realtime_ready = bytearray(count)
+        # The input the last message came from, for receive_sysex.
+        self._last = 0
+
+    @property
+    def midi_ins(self):
+        return self._midi_ins
+
+    @property
+    def error_count(self):
+        return sum(midi_in.error_count for midi_in in self._midi_ins)
+
+    @property
+    def error_counts(self):
+        """The error count of each input, in the order they were given."""
+        return tuple(midi_in.error_count for midi_in in self._midi_ins)
+
+    @micropython.native
+    def _next(self, pending, ready, realtime, into):
+        midi_ins = self._midi_ins
+        best = -1
+        for n in range(len(midi_ins)):
+            if not ready[n]:
+                if realtime:
+                    message = midi_ins[n].receive_realtime(pending[n])
+                else:
+                    message = midi_ins[n].receive(pending[n])
+                if message is None:
+                    continue
+                ready[n] = 1
+            if (
+                best < 0
+                or smolmidi.ticks_diff(pending[n].timestamp, pending[best].timestamp)
+                < 0
+            ):
+                best = n
+
+        if best < 0:
+            return None
+
+        ready[best] = 0
+        self._last = best
+        if into is not None:
+            return into.copy_from(pending[best])
+        return pending[best]
+
+    def receive_realtime(self, into=None):
+        return self._next(self._realtime_pending, self._realtime_ready, True, into)
+
+    def receive(self, into=None):
+        message = self.receive_realtime(into)
+        if message is not None:
+            return message
+        return self._next(self._pending, self._ready, False, into)
+
+    def receive_sysex(self, *args, **kwargs):
+        return self._midi_ins[self._last].receive_sysex(*args, **kwargs)
+
+    def receive_sysex_into(self, *args, **kwargs):
+        return self._midi_ins[self._last].receive_sysex_into(*args, **kwargs)
+
+    def ignore(self, *args, **kwargs):
+        for midi_in in self._midi_ins:
+            midi_in.ignore(*args, **kwargs)
+
+    def accept(self, *args, **kwargs):
+        for midi_in in self._midi_ins:
+            midi_in.accept(*args, **kwargs)
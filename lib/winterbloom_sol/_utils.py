@@ -69,20 +69,6 @@ def color_wheel(pos):
     return (r, g, b)
 
 
-class ValueForwardingProperty:
-    def __init__(self, name, property="value"):
-        self._name = name
-        self._property = property
-
-    @micropython.native
-    def __get__(self, obj, objtype):
-        return getattr(getattr(obj, self._name), self._property)
-
-    @micropython.native
-    def __set__(self, obj, val):
-        setattr(getattr(obj, self._name), self._property, val)
-
-
 @micropython.native
 def lerp(start, end, time):
     return start + time * (end - start)
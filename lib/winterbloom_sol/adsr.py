@@ -87,6 +87,11 @@ class ADSR:
         self._release_start_level = self._accum
         self._last_update = time.monotonic_ns()
 
+    @property
+    def active(self):
+        """Whether the output is moving (attack, decay or release)."""
+        return self._state == 1 or self._state == 2 or self._state == 4
+
     @property
     def output(self):
         now = time.monotonic_ns()
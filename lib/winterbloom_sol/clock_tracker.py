@@ -0,0 +1,145 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Alethea Flowers for Winterbloom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import micropython
+import winterbloom_smolmidi as smolmidi
+
+# MIDI clock ticks per quarter note.
+_PPQN = micropython.const(24)
+_US_PER_MINUTE = 60000000
+
+
+class ClockTracker:
+    """Follows MIDI clock: counts its ticks, estimates the tempo and tells
+    where in the beat any instant falls.
+
+    Each tick is timestamped when it's received. The tempo is smoothed by
+    a phase-locked loop (an alpha-beta filter): every tick is compared
+    with when the loop expected it, and a ``gain`` fraction of the error
+    corrects the tick's time and a smaller one the tick period, so the
+    jitter of USB MIDI doesn't show in ``bpm`` or ``phase``. A jump in
+    the tempo by more than half resets the estimate to the last interval.
+
+    ``phase`` interpolates between ticks, so tempo-synced LFOs and clock
+    divided gates move smoothly without reading the clock in the loop::
+
+        # A sine LFO over one bar and a gate on every eighth note.
+        lfo = math.sin(2 * math.pi * state.clock_tracker.phase(4))
+        outputs.gate_1 = state.clock_tracker.phase(0.5) < 0.5
+
+    Sol ticks the tracker, starts it on START and resumes it on CONTINUE.
+    Nothing here allocates.
+    """
+
+    def __init__(self, gain=0.25):
+        self._alpha = gain
+        # A critically damped loop for that gain.
+        self._beta = gain * gain / (2 - gain)
+        self.start()
+        self._period = 0.0
+
+    def start(self):
+        """Starts counting ticks from the beginning, for START. The tempo
+        estimate is kept until ticks say otherwise."""
+        self._ticks = -1
+        self.resume()
+
+    def resume(self):
+        """Forgets when the last tick came, for CONTINUE: the time between
+        it and the next one is a pause, not a tick."""
+        self._synced = False
+        self._tick_time = 0
+        self._last = 0
+
+    @property
+    def ticks(self):
+        """Ticks since START, the first one after it being tick 0."""
+        return self._ticks
+
+    @property
+    def period_us(self):
+        """The estimated time between ticks in microseconds, 0 until the
+        second tick."""
+        return self._period
+
+    @property
+    def bpm(self):
+        """The estimated tempo in quarter notes per minute, 0 until the
+        second tick."""
+        if not self._period:
+            return 0
+        return _US_PER_MINUTE / (self._period * _PPQN)
+
+    @micropython.native
+    def tick(self, timestamp):
+        """Records a clock tick received at ``timestamp`` (in
+        smolmidi.ticks_us)."""
+        self._ticks += 1
+        if not self._synced:
+            self._synced = True
+            self._tick_time = self._last = timestamp
+            return
+
+        interval = smolmidi.ticks_diff(timestamp, self._last)
+        self._last = timestamp
+        if interval <= 0:
+            return
+        period = self._period
+        error = smolmidi.ticks_diff(
+            timestamp, smolmidi.ticks_add(self._tick_time, int(period))
+        )
+        if not period or error > period / 2 or -error > period / 2:
+            self._period = float(interval)
+            self._tick_time = timestamp
+            return
+
+        self._tick_time = smolmidi.ticks_add(
+            self._tick_time, int(period + error * self._alpha)
+        )
+        self._period = period + error * self._beta
+
+    @micropython.native
+    def phase(self, beats=1):
+        """Where now is, from 0 to 1, in each span of ``beats`` quarter
+        notes since START. ``beats`` is a multiple of 1/24 of a beat:
+        1 for quarter notes, 0.25 for sixteenths, 4 for a 4/4 bar.
+
+        Between ticks, the phase moves on at the estimated tempo, and
+        stops at the next tick's time until that tick arrives.
+        """
+        span = int(beats * _PPQN + 0.5)
+        if span < 1:
+            span = 1
+        ticks = self._ticks
+        if ticks < 0:
+            return 0.0
+        fraction = 0.0
+        if self._synced and self._period:
+            fraction = (
+                smolmidi.ticks_diff(smolmidi.ticks_us(), self._tick_time)
+                / self._period
+            )
+            if fraction < 0.0:
+                fraction = 0.0
+            elif fraction > 0.999:
+                fraction = 0.999
+        return ((ticks % span) + fraction) / span
@@ -0,0 +1,121 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Alethea Flowers for Winterbloom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import array
+import sys
+
+import micropython
+import supervisor
+
+# Each record is an event id, the time in milliseconds and three values.
+_FIELDS = micropython.const(5)
+
+
+class EventLog:
+    """A ring buffer of fixed-size log records.
+
+    Printing from the run loop blocks until the serial port has sent the
+    text, which takes far longer than anything else the loop does. Code
+    in the loop writes records instead: an event id and up to three
+    integers, with no formatting and no allocations. The records are
+    formatted and printed later by ``drain``, which Sol calls when the
+    loop is idle (in ``run_idle``) or when ``l`` is sent over the serial
+    console::
+
+        CALLS = eventlog.event("{} calls in the last second")
+        ...
+        eventlog.write(CALLS, calls)
+
+    When the ring is full, new records overwrite the oldest ones and
+    ``dropped`` counts them.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.dropped = 0
+        self._records = array.array("l", [0] * (size * _FIELDS))
+        self._formats = []
+        self._head = 0
+        self._count = 0
+
+    def event(self, format):
+        """Registers an event and returns its id. ``format`` is a
+        str.format string for the event's values."""
+        self._formats.append(format)
+        return len(self._formats) - 1
+
+    def __len__(self):
+        return self._count
+
+    @micropython.native
+    def write(self, event, value_0=0, value_1=0, value_2=0):
+        records = self._records
+        n = self._head * _FIELDS
+        records[n] = event
+        records[n + 1] = supervisor.ticks_ms()
+        records[n + 2] = value_0
+        records[n + 3] = value_1
+        records[n + 4] = value_2
+
+        self._head += 1
+        if self._head == self.size:
+            self._head = 0
+        if self._count == self.size:
+            self.dropped += 1
+        else:
+            self._count += 1
+
+    def drain(self, limit=None, file=None):
+        """Prints up to ``limit`` of the oldest records and removes them
+        from the ring. Returns how many it printed."""
+        file = file or sys.stdout
+        count = self._count if limit is None else min(limit, self._count)
+        records = self._records
+        tail = self._head - self._count
+        if tail < 0:
+            tail += self.size
+
+        if self.dropped:
+            print("{} log records dropped".format(self.dropped), file=file)
+            self.dropped = 0
+
+        for _ in range(count):
+            n = tail * _FIELDS
+            print(
+                "[{}] ".format(records[n + 1])
+                + self._formats[records[n]].format(
+                    records[n + 2], records[n + 3], records[n + 4]
+                ),
+                file=file,
+            )
+            tail += 1
+            if tail == self.size:
+                tail = 0
+            self._count -= 1
+
+        return count
+
+
+# The log that Sol drains, for anything to write to.
+default = EventLog()
+event = default.event
+write = default.write
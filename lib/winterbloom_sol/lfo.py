@@ -31,6 +31,9 @@ _NS_TO_S = 1000000000
 
 
 class _PhaseAccumulator:
+    # An LFO's output never stops moving.
+    active = True
+
     def __init__(self, frequency):
         self.frequency = frequency
         self._phase = 0
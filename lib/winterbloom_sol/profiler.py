@@ -0,0 +1,145 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Alethea Flowers for Winterbloom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import array
+import sys
+
+import micropython
+import winterbloom_smolmidi as smolmidi
+
+# Bucket n counts durations of n bits, that is below 2 ** n microseconds.
+# The last bucket also counts anything longer.
+_BUCKETS = micropython.const(24)
+
+RECEIVE = micropython.const(0)
+PROCESS = micropython.const(1)
+LOOP = micropython.const(2)
+STEP = micropython.const(3)
+
+PHASES = ("receive", "process", "loop", "step")
+
+
+class Profiler:
+    """Times each phase of Sol's run loop.
+
+    Durations are measured in microseconds and counted in histograms with
+    power of two buckets, so recording one costs a few integer operations
+    and never allocates. Enable it with ``Sol(profile=True)`` and read the
+    results with ``report``. While Sol is running, send ``p`` over the
+    serial console to print a report or ``r`` to reset the counts.
+
+    The percentiles in the report are rounded up to the top of their
+    bucket. The maximums are exact.
+
+    CircuitPython has no microsecond clock that doesn't allocate, so on the
+    device smolmidi.ticks_us only moves in 1 ms steps. A phase is recorded
+    as 0 unless a millisecond tick happens during it, and then as at least
+    1 ms, so the histograms show how often phases cross a tick rather than
+    how long short phases take. Durations of a millisecond or more are
+    within 1 ms. The host simulator has microsecond resolution.
+    """
+
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self._histograms = array.array("L", [0] * (len(phases) * _BUCKETS))
+        self._counts = array.array("L", [0] * len(phases))
+        self._maximums = array.array("l", [0] * len(phases))
+        self._start = 0
+
+    def reset(self):
+        for n in range(len(self._histograms)):
+            self._histograms[n] = 0
+        for n in range(len(self.phases)):
+            self._counts[n] = 0
+            self._maximums[n] = 0
+
+    @micropython.native
+    def start(self):
+        """Starts timing the first phase."""
+        self._start = smolmidi.ticks_us()
+
+    @micropython.native
+    def mark(self, phase):
+        """Records the time since the previous mark (or start) for
+        ``phase`` and starts timing the next phase."""
+        now = smolmidi.ticks_us()
+        elapsed = smolmidi.ticks_diff(now, self._start)
+        self._start = now
+
+        if elapsed > self._maximums[phase]:
+            self._maximums[phase] = elapsed
+
+        bucket = 0
+        while elapsed and bucket < _BUCKETS - 1:
+            elapsed >>= 1
+            bucket += 1
+        self._histograms[phase * _BUCKETS + bucket] += 1
+        self._counts[phase] += 1
+
+    def count(self, phase):
+        return self._counts[phase]
+
+    def maximum(self, phase):
+        return self._maximums[phase]
+
+    def percentile(self, phase, fraction):
+        """Returns the duration in microseconds that ``fraction`` of the
+        recorded durations for ``phase`` are at or below."""
+        count = self._counts[phase]
+        if not count:
+            return 0
+
+        target = fraction * count
+        total = 0
+        for bucket in range(_BUCKETS):
+            total += self._histograms[phase * _BUCKETS + bucket]
+            if total >= target:
+                break
+        return min((1 << bucket) - 1, self._maximums[phase])
+
+    def report(self, file=None):
+        """Prints the count, p50, p99 and maximum for each phase."""
+        file = file or sys.stdout
+        print(
+            "{:<10} {:>10} {:>8} {:>8} {:>8}".format(
+                "phase", "count", "p50 us", "p99 us", "max us"
+            ),
+            file=file,
+        )
+        for phase, name in enumerate(self.phases):
+            print(
+                "{:<10} {:>10} {:>8} {:>8} {:>8}".format(
+                    name,
+                    self._counts[phase],
+                    self.percentile(phase, 0.5),
+                    self.percentile(phase, 0.99),
+                    self._maximums[phase],
+                ),
+                file=file,
+            )
+
+    def command(self, char):
+        """Handles a command character read from the serial console."""
+        if char == "p":
+            self.report()
+        elif char == "r":
+            self.reset()
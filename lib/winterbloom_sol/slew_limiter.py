@@ -22,6 +22,7 @@
 
 import micropython
 import supervisor
+from adafruit_ticks import ticks_diff
 
 from winterbloom_sol import _utils
 
@@ -87,6 +88,15 @@ class SlewLimiter:
         self._target = value
         self._set_time = supervisor.ticks_ms()
 
+    @property
+    def active(self):
+        """Whether the output is still moving towards the target."""
+        if self._target is None:
+            return False
+        # supervisor.ticks_ms wraps around, so compare with ticks_diff.
+        elapsed = ticks_diff(supervisor.ticks_ms(), self._set_time)
+        return elapsed < self.rate * _MS_TO_S
+
     @property
     def output(self):
         if self._target is None:
@@ -94,6 +104,6 @@ class SlewLimiter:
 
         now = supervisor.ticks_ms()
         rate_s = self.rate * _MS_TO_S
-        delta = min(1.0, (now - self._set_time) / rate_s)
+        delta = min(1.0, ticks_diff(now, self._set_time) / rate_s)
 
         return _utils.lerp(self._last, self._target, delta)
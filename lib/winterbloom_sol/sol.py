@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import sys
 import time
 
 import board
@@ -31,7 +32,161 @@ import usb_midi
 import winterbloom_smolmidi as smolmidi
 import winterbloom_voltageio as voltageio
 from winterbloom_ad_dacs import ad5686, ad5689
-from winterbloom_sol import _calibration, _midi_ext, _utils, trigger
+from winterbloom_sol import (
+    _calibration,
+    _midi_ext,
+    _utils,
+    eventlog,
+    profiler,
+    trigger,
+)
+from winterbloom_sol.clock_tracker import ClockTracker
+
+# HeldNotes' list head, in place of a note number.
+_HEAD = micropython.const(128)
+
+
+def _bit_tables():
+    highest = bytearray(256)
+    lowest = bytearray(256)
+    for n in range(2, 256):
+        highest[n] = highest[n >> 1] + 1
+        lowest[n] = 0 if n & 1 else lowest[n >> 1] + 1
+    return bytes(highest), bytes(lowest)
+
+
+# The highest and lowest set bit of each byte value.
+_HIGHEST_BIT, _LOWEST_BIT = _bit_tables()
+
+
+class HeldNotes:
+    """The notes that are held down, from the oldest to the latest.
+
+    Works like a list of note numbers (``notes[-1]``, ``len(notes)``,
+    ``notes.clear()``, iterating, ``in``), but holds each note once:
+    playing a held note again makes it the latest. Adding and removing
+    notes takes constant time and never allocates. The held notes are a
+    128-bit bitmap, which makes ``highest`` and ``lowest`` a scan of 16
+    bytes, and a doubly linked list in two bytearrays keeps their order.
+    """
+
+    def __init__(self):
+        # Bit n & 7 of byte n >> 3 is set while note n is held.
+        self._held = bytearray(16)
+        # Links through the held notes. _HEAD's next note is the oldest and
+        # its previous one the latest.
+        self._next = bytearray(_HEAD + 1)
+        self._prev = bytearray(_HEAD + 1)
+        self._next[_HEAD] = _HEAD
+        self._prev[_HEAD] = _HEAD
+        self._count = 0
+
+    @micropython.native
+    def add(self, note):
+        """Makes ``note`` the latest held note."""
+        held = self._held
+        next_notes = self._next
+        prev_notes = self._prev
+        bit = 1 << (note & 7)
+        if held[note >> 3] & bit:
+            # Already held, unlink it from where it is.
+            next_notes[prev_notes[note]] = next_notes[note]
+            prev_notes[next_notes[note]] = prev_notes[note]
+        else:
+            held[note >> 3] |= bit
+            self._count += 1
+
+        latest = prev_notes[_HEAD]
+        next_notes[latest] = note
+        prev_notes[note] = latest
+        next_notes[note] = _HEAD
+        prev_notes[_HEAD] = note
+
+    @micropython.native
+    def discard(self, note):
+        """Releases ``note``, if it's held."""
+        held = self._held
+        bit = 1 << (note & 7)
+        if not held[note >> 3] & bit:
+            return
+        held[note >> 3] &= ~bit
+        self._count -= 1
+        next_notes = self._next
+        prev_notes = self._prev
+        next_notes[prev_notes[note]] = next_notes[note]
+        prev_notes[next_notes[note]] = prev_notes[note]
+
+    def clear(self):
+        for n in range(16):
+            self._held[n] = 0
+        self._next[_HEAD] = _HEAD
+        self._prev[_HEAD] = _HEAD
+        self._count = 0
+
+    @property
+    def latest(self):
+        return self._prev[_HEAD] if self._count else None
+
+    @property
+    def oldest(self):
+        return self._next[_HEAD] if self._count else None
+
+    @property
+    @micropython.native
+    def highest(self):
+        held = self._held
+        for byte in range(15, -1, -1):
+            if held[byte]:
+                return (byte << 3) + _HIGHEST_BIT[held[byte]]
+        return None
+
+    @property
+    @micropython.native
+    def lowest(self):
+        held = self._held
+        for byte in range(16):
+            if held[byte]:
+                return (byte << 3) + _LOWEST_BIT[held[byte]]
+        return None
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, note):
+        return 0 <= note < _HEAD and bool(self._held[note >> 3] & (1 << (note & 7)))
+
+    @micropython.native
+    def __getitem__(self, index):
+        if not isinstance(index, int):
+            return list(self)[index]
+        if index < 0:
+            index += self._count
+            if index < 0:
+                raise IndexError("note index out of range")
+            # Negative indexes count back from the latest note.
+            steps = self._count - 1 - index
+            note = self._prev[_HEAD]
+            while steps:
+                note = self._prev[note]
+                steps -= 1
+            return note
+        if index >= self._count:
+            raise IndexError("note index out of range")
+        note = self._next[_HEAD]
+        while index:
+            note = self._next[note]
+            index -= 1
+        return note
+
+    def __iter__(self):
+        note = self._next[_HEAD]
+        while note != _HEAD:
+            next_note = self._next[note]
+            yield note
+            note = next_note
+
+    def __repr__(self):
+        return "HeldNotes({})".format(list(self))
 
 
 class State:
@@ -40,8 +195,8 @@ class State:
     parameters.
     """
 
-    def __init__(self):
-        self.notes = []
+    def __init__(self, clock_tracker=None):
+        self.notes = HeldNotes()
         self.velocity = 0
         self.pitch_bend = 0
         self.pressure = 0
@@ -49,43 +204,39 @@ class State:
         self._aftertouch = bytearray(128)
         self.playing = False
         self.clock = 0
-        self.clock_frequency = 0
+        self.clock_tracker = clock_tracker or ClockTracker()
 
     def note_on(self, note):
-        self.notes.append(note)
+        self.notes.add(note)
 
     def note_off(self, note):
-        while True:
-            try:
-                self.notes.remove(note)
-            except ValueError:
-                break
+        self.notes.discard(note)
         self._aftertouch[note] = 0
 
     @property
-    @micropython.native
     def note(self):
-        return self.notes[-1] if self.notes else None
+        return self.notes.latest
+
+    @property
+    def clock_frequency(self):
+        """The MIDI clock's tempo in quarter notes per minute."""
+        return self.clock_tracker.bpm
 
     @property
-    @micropython.native
     def latest_note(self):
-        return self.notes[-1] if self.notes else None
+        return self.notes.latest
 
     @property
-    @micropython.native
     def oldest_note(self):
-        return self.notes[0] if self.notes else None
+        return self.notes.oldest
 
     @property
-    @micropython.native
     def highest_note(self):
-        return max(self.notes) if self.notes else None
+        return self.notes.highest
 
     @property
-    @micropython.native
     def lowest_note(self):
-        return min(self.notes) if self.notes else None
+        return self.notes.lowest
 
     @micropython.viper
     def cc(self, number):
@@ -96,14 +247,40 @@ class State:
         return self._aftertouch[note] / 127.0
 
 
+def _led_tables():
+    wheel = bytearray(256 * 3)
+    for n in range(256):
+        wheel[n * 3 : n * 3 + 3] = bytes(_utils.color_wheel(n))
+    fade = bytes(round(255 * (1 - n / 256)) for n in range(256))
+    return bytes(wheel), fade
+
+
+# The color of each hue, as r, g, b bytes, and how much white is mixed into
+# the color (0-255) at each 256th of a pulse.
+_WHEEL, _FADE = _led_tables()
+_PULSE_US = micropython.const(200000)
+
+
 class StatusLED:
-    def __init__(self):
+    """Sol's NeoPixel, which changes hue on MIDI messages and pulses white.
+
+    ``spin``, ``pulse`` and setting ``hue`` only change what the LED should
+    show, ``step`` draws it at most ``frame_rate`` times a second, and only
+    writes the NeoPixel if the color changed. Colors come from tables made
+    once at import, so drawing a frame is integer math.
+    """
+
+    def __init__(self, frame_rate=30):
         self._led = neopixel.NeoPixel(board.NEOPIXEL, 1, pixel_order=(0, 1, 2))
         self._led.brightness = 0.1
-        self._led[0] = (0, 255, 255)
+        self._color = 0x00FFFF
+        self._led[0] = self._color
         self._hue = 0
-        self._hue_rgb = (0, 255, 255)
-        self._pulse_time = None
+        self._pulse_start = None
+        self._frame_us = 1000000 // frame_rate
+        self._next_frame = smolmidi.ticks_us()
+        # Whether the LED needs drawing.
+        self._dirty = False
 
     @property
     def hue(self):
@@ -112,36 +289,151 @@ class StatusLED:
     @hue.setter
     def hue(self, hue):
         self._hue = hue
-        self._led[0] = self._hue_rgb = _utils.color_wheel(self._hue)
+        if not self._dirty:
+            self._wake(smolmidi.ticks_us())
 
     def spin(self):
-        self.hue += 5
+        self._hue = (int(self._hue) + 5) & 0xFF
+        if not self._dirty:
+            self._wake(smolmidi.ticks_us())
 
     def pulse(self):
-        self._pulse_time = time.monotonic_ns()
-        self._led[0] = (255, 255, 255)
+        now = smolmidi.ticks_us()
+        self._pulse_start = now
+        if not self._dirty:
+            self._wake(now)
+
+    @micropython.native
+    def _wake(self, now):
+        self._dirty = True
+        # The frame deadline only moves while the LED is being drawn, so
+        # after a long idle time it can be far enough behind to look like
+        # it's ahead. A deadline can't really be more than a frame ahead.
+        if smolmidi.ticks_diff(self._next_frame, now) > self._frame_us:
+            self._next_frame = now
+
+    @property
+    def active(self):
+        """Whether a change or a pulse fading out is still to be drawn."""
+        return self._dirty
 
     @micropython.native
     def step(self):
-        if self._pulse_time is None:
+        if not self._dirty:
             return
+        now = smolmidi.ticks_us()
+        if smolmidi.ticks_diff(now, self._next_frame) < 0:
+            return
+        next_frame = smolmidi.ticks_add(self._next_frame, self._frame_us)
+        # Don't draw frames in a burst to catch up after a long loop.
+        if smolmidi.ticks_diff(now, next_frame) >= 0:
+            next_frame = smolmidi.ticks_add(now, self._frame_us)
+        self._next_frame = next_frame
+
+        index = (int(self._hue) & 0xFF) * 3
+        r = _WHEEL[index]
+        g = _WHEEL[index + 1]
+        b = _WHEEL[index + 2]
+        self._dirty = False
+        if self._pulse_start is not None:
+            elapsed = smolmidi.ticks_diff(now, self._pulse_start)
+            if elapsed < _PULSE_US:
+                white = _FADE[elapsed * 256 // _PULSE_US]
+                r += (255 - r) * white // 255
+                g += (255 - g) * white // 255
+                b += (255 - b) * white // 255
+                self._dirty = True
+            else:
+                self._pulse_start = None
+
+        color = (r << 16) | (g << 8) | b
+        if color != self._color:
+            self._color = color
+            self._led[0] = color
+
+
+# Outputs' channel indexes by name.
+_CV_INDEXES = {"a": 0, "b": 1, "c": 2, "d": 3, "A": 0, "B": 1, "C": 2, "D": 3}
+_GATE_INDEXES = {1: 0, 2: 1, 3: 2, 4: 3}
+
+
+class _CVProperty:
+    """An Outputs property for a CV output's voltage. CV C and D don't
+    exist on the beta board, which has a two channel DAC."""
+
+    def __init__(self, index):
+        self._index = index
+
+    @micropython.native
+    def __get__(self, obj, objtype):
+        if obj is None:
+            return self
+        try:
+            return obj._cvs[self._index].voltage
+        except IndexError:
+            raise self._missing()
+
+    @micropython.native
+    def __set__(self, obj, value):
+        try:
+            obj._cvs[self._index].voltage = value
+        except IndexError:
+            raise self._missing()
+
+    def _missing(self):
+        return AttributeError("this board has no CV {}".format("ABCD"[self._index]))
+
+
+class _GateProperty:
+    """An Outputs property for a gate output's value. Setting it cancels
+    the gate's triggers and retriggers."""
+
+    def __init__(self, index):
+        self._index = index
+
+    @micropython.native
+    def __get__(self, obj, objtype):
+        if obj is None:
+            return self
+        return obj._gates[self._index].value
+
+    @micropython.native
+    def __set__(self, obj, value):
+        obj.set_gate_index(self._index, value)
 
-        pulse_dt = min(
-            ((time.monotonic_ns() - self._pulse_time) / 1000000000) / 0.2, 1.0
-        )
-        self._led[0] = (
-            int(_utils.lerp(255, self._hue_rgb[0], pulse_dt)),
-            int(_utils.lerp(255, self._hue_rgb[1], pulse_dt)),
-            int(_utils.lerp(255, self._hue_rgb[2], pulse_dt)),
-        )
 
-        if pulse_dt == 1.0:
-            self._pulse_time = None
+class _ChannelProperty:
+    """A read-only Outputs property for an item of one of its channel
+    tables, such as a gate's Trigger."""
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __get__(self, obj, objtype):
+        if obj is None:
+            return self
+        return getattr(obj, self._table)[self._index]
+
+    def __set__(self, obj, value):
+        raise AttributeError("can't set attribute")
 
 
 class Outputs:
     """Manages all of the outputs for the Sol board and provides
-    easy access to set them."""
+    easy access to set them.
+
+    Outputs can be set by name (``outputs.cv_a = 1.0``,
+    ``outputs.set_gate(1, True)``) or by index, 0 to 3 for CV A to D
+    and for gates 1 to 4, which skips looking up the name::
+
+        outputs.set_cv_index(0, 1.0)
+        outputs.set_gate_index(0, True)
+
+    ``set_cvs`` and ``set_gates`` set several outputs at once.
+
+    MIDI messages written to ``midi`` (a MidiOut for the USB port) are
+    sent together once per step."""
 
     def __init__(self):
         if _utils.is_beta():
@@ -177,33 +469,58 @@ class Outputs:
         self._gate_4 = digitalio.DigitalInOut(board.G4)
         self._gate_4.direction = digitalio.Direction.OUTPUT
 
-        self._gate_1_trigger = trigger.Trigger(self._gate_1)
-        self._gate_2_trigger = trigger.Trigger(self._gate_2)
-        self._gate_3_trigger = trigger.Trigger(self._gate_3)
-        self._gate_4_trigger = trigger.Trigger(self._gate_4)
-        self._gate_1_retrigger = trigger.Retrigger(self._gate_1)
-        self._gate_2_retrigger = trigger.Retrigger(self._gate_2)
-        self._gate_3_retrigger = trigger.Retrigger(self._gate_3)
-        self._gate_4_retrigger = trigger.Retrigger(self._gate_4)
+        # Every gate's triggers and retriggers are ended by one scheduler.
+        self._triggers = triggers = trigger.TriggerScheduler()
+        self._gate_1_trigger = trigger.Trigger(self._gate_1, scheduler=triggers)
+        self._gate_2_trigger = trigger.Trigger(self._gate_2, scheduler=triggers)
+        self._gate_3_trigger = trigger.Trigger(self._gate_3, scheduler=triggers)
+        self._gate_4_trigger = trigger.Trigger(self._gate_4, scheduler=triggers)
+        self._gate_1_retrigger = trigger.Retrigger(self._gate_1, scheduler=triggers)
+        self._gate_2_retrigger = trigger.Retrigger(self._gate_2, scheduler=triggers)
+        self._gate_3_retrigger = trigger.Retrigger(self._gate_3, scheduler=triggers)
+        self._gate_4_retrigger = trigger.Retrigger(self._gate_4, scheduler=triggers)
+
+        # The channel tables, by index.
+        if dac_driver == ad5686:
+            self._cvs = (self._cv_a, self._cv_b, self._cv_c, self._cv_d)
+        else:
+            self._cvs = (self._cv_a, self._cv_b)
+        self._gates = (self._gate_1, self._gate_2, self._gate_3, self._gate_4)
+        self._gate_triggers = (
+            self._gate_1_trigger,
+            self._gate_2_trigger,
+            self._gate_3_trigger,
+            self._gate_4_trigger,
+        )
+        self._gate_retriggers = (
+            self._gate_1_retrigger,
+            self._gate_2_retrigger,
+            self._gate_3_retrigger,
+            self._gate_4_retrigger,
+        )
 
         self.led = StatusLED()
 
-    cv_a = _utils.ValueForwardingProperty("_cv_a", "voltage")
-    cv_b = _utils.ValueForwardingProperty("_cv_b", "voltage")
-    cv_c = _utils.ValueForwardingProperty("_cv_c", "voltage")
-    cv_d = _utils.ValueForwardingProperty("_cv_d", "voltage")
-    gate_1 = _utils.ValueForwardingProperty("_gate_1")
-    trigger_gate_1 = _utils.ValueForwardingProperty("_gate_1_trigger", "trigger")
-    retrigger_gate_1 = _utils.ValueForwardingProperty("_gate_1_retrigger", "retrigger")
-    gate_2 = _utils.ValueForwardingProperty("_gate_2")
-    trigger_gate_2 = _utils.ValueForwardingProperty("_gate_2_trigger", "trigger")
-    retrigger_gate_2 = _utils.ValueForwardingProperty("_gate_2_retrigger", "retrigger")
-    gate_3 = _utils.ValueForwardingProperty("_gate_3")
-    trigger_gate_3 = _utils.ValueForwardingProperty("_gate_3_trigger", "trigger")
-    retrigger_gate_3 = _utils.ValueForwardingProperty("_gate_3_retrigger", "retrigger")
-    gate_4 = _utils.ValueForwardingProperty("_gate_4")
-    trigger_gate_4 = _utils.ValueForwardingProperty("_gate_4_trigger", "trigger")
-    retrigger_gate_4 = _utils.ValueForwardingProperty("_gate_4_retrigger", "retrigger")
+        # USB MIDI sends every message in its own packet, so running status
+        # wouldn't save anything.
+        self.midi = smolmidi.MidiOut(usb_midi.ports[1], enable_running_status=False)
+
+    cv_a = _CVProperty(0)
+    cv_b = _CVProperty(1)
+    cv_c = _CVProperty(2)
+    cv_d = _CVProperty(3)
+    gate_1 = _GateProperty(0)
+    trigger_gate_1 = _ChannelProperty("_gate_triggers", 0)
+    retrigger_gate_1 = _ChannelProperty("_gate_retriggers", 0)
+    gate_2 = _GateProperty(1)
+    trigger_gate_2 = _ChannelProperty("_gate_triggers", 1)
+    retrigger_gate_2 = _ChannelProperty("_gate_retriggers", 1)
+    gate_3 = _GateProperty(2)
+    trigger_gate_3 = _ChannelProperty("_gate_triggers", 2)
+    retrigger_gate_3 = _ChannelProperty("_gate_retriggers", 2)
+    gate_4 = _GateProperty(3)
+    trigger_gate_4 = _ChannelProperty("_gate_triggers", 3)
+    retrigger_gate_4 = _ChannelProperty("_gate_retriggers", 3)
 
     def __str__(self):
         return "<Outputs A:{}, B:{}, C:{}, D:{}, 1:{}, 2:{}, 3:{}, 4:{}>".format(
@@ -217,38 +534,91 @@ class Outputs:
             self.gate_4,
         )
 
-    def set_cv(self, output, value):
-        output = output.lower()
-        if output not in ["a", "b", "c", "d"]:
+    def _cv_index(self, output):
+        index = _CV_INDEXES.get(output)
+        if index is None or index >= len(self._cvs):
             raise ValueError("No such CV channel '{}'".format(output))
-        getattr(self, "_cv_" + output).voltage = value
+        return index
 
-    def set_gate(self, output, value):
-        if output not in list(range(1, 5)):
+    def _gate_index(self, output):
+        index = _GATE_INDEXES.get(output)
+        if index is None:
             raise ValueError("No such gate channel '{}'".format(output))
-        getattr(self, "_gate_{}".format(output)).value = value
+        return index
+
+    def set_cv(self, output, value):
+        self._cvs[self._cv_index(output)].voltage = value
+
+    def set_gate(self, output, value):
+        self.set_gate_index(self._gate_index(output), value)
 
     def trigger_gate(self, output):
-        if output not in list(range(1, 5)):
-            raise ValueError("No such gate channel '{}'".format(output))
-        getattr(self, "_gate_{}_trigger".format(output))()
+        self._gate_triggers[self._gate_index(output)]()
 
     def retrigger_gate(self, output):
-        if output not in list(range(1, 5)):
-            raise ValueError("No such gate channel '{}'".format(output))
-        getattr(self, "_gate_{}_retrigger".format(output))()
+        self._gate_retriggers[self._gate_index(output)]()
+
+    @micropython.native
+    def set_cv_index(self, index, value):
+        """Sets the voltage of CV output ``index``, 0 for A to 3 for D."""
+        self._cvs[index].voltage = value
+
+    @micropython.native
+    def set_gate_index(self, index, value):
+        """Sets gate output ``index``, 0 for gate 1 to 3 for gate 4."""
+        if self._triggers.active:
+            self._cancel_pulses(index)
+        self._gates[index].value = value
+
+    def _cancel_pulses(self, index):
+        # Setting a gate overrides its triggers and retriggers, so queued
+        # ones don't pulse it after the fact.
+        self._gate_triggers[index].cancel()
+        self._gate_retriggers[index].cancel()
+
+    @micropython.native
+    def trigger_gate_index(self, index):
+        self._gate_triggers[index]()
+
+    @micropython.native
+    def retrigger_gate_index(self, index):
+        self._gate_retriggers[index]()
+
+    @micropython.native
+    def set_cvs(self, values):
+        """Sets the CV outputs to a sequence of voltages, starting with A.
+        Outputs with a value of None aren't changed."""
+        cvs = self._cvs
+        for index in range(len(values)):
+            value = values[index]
+            if value is not None:
+                cvs[index].voltage = value
+
+    @micropython.native
+    def set_gates(self, values):
+        """Sets the gate outputs to a sequence of values, starting with
+        gate 1. Outputs with a value of None aren't changed."""
+        gates = self._gates
+        pulses = self._triggers.active
+        for index in range(len(values)):
+            value = values[index]
+            if value is not None:
+                if pulses:
+                    self._cancel_pulses(index)
+                gates[index].value = value
+
+    @property
+    @micropython.native
+    def active(self):
+        """Whether step still has something to do: a trigger or retrigger
+        in progress or the LED fading out."""
+        return self._triggers.active or self.led.active
 
     @micropython.native
     def step(self):
-        self._gate_1_trigger.step()
-        self._gate_2_trigger.step()
-        self._gate_3_trigger.step()
-        self._gate_4_trigger.step()
-        self._gate_1_retrigger.step()
-        self._gate_2_retrigger.step()
-        self._gate_3_retrigger.step()
-        self._gate_4_retrigger.step()
+        self._triggers.step()
         self.led.step()
+        self.midi.flush()
 
 
 class _StopLoop(Exception):
@@ -257,17 +627,81 @@ class _StopLoop(Exception):
     pass
 
 
-stat = [0] * 100
+class Sol:
+    """Runs a loop function with the MIDI state and the outputs.
 
+    ``midi_ports`` are the ports to receive MIDI from, by default just the
+    USB port. Messages from several ports are merged into one stream, for
+    example to also take DIN MIDI from a UART::
 
-class Sol:
-    def __init__(self):
+        uart = busio.UART(rx=board.RX, baudrate=31250, timeout=0)
+        sol = Sol(midi_ports=(usb_midi.ports[0], uart))
+
+    With ``profile=True``, ``run`` times each phase of the loop with a
+    Profiler (available as ``profiler``), see winterbloom_sol.profiler.
+
+    Log records written to winterbloom_sol.eventlog (available as ``log``)
+    are printed when ``l`` is sent over the serial console, and by
+    ``run_idle`` while it's idle.
+    """
+
+    def __init__(self, midi_ports=None, profile=False):
         self.outputs = Outputs()
-        self._midi_in = _midi_ext.DeduplicatingMidiIn(
-            smolmidi.MidiIn(usb_midi.ports[0])
-        )
+        self.profiler = profiler.Profiler() if profile else None
+        self.log = eventlog.default
+        if midi_ports is None:
+            midi_ports = (usb_midi.ports[0],)
+        midi_ins = [smolmidi.BufferedMidiIn(port) for port in midi_ports]
+        if len(midi_ins) == 1:
+            midi_in = midi_ins[0]
+        else:
+            midi_in = _midi_ext.MergedMidiIn(midi_ins)
+        self._midi_in = _midi_ext.DeduplicatingMidiIn(midi_in)
+        # Nothing in State uses active sensing, and it would spin the LED.
+        self._midi_in.ignore(smolmidi.ACTIVE_SENSING)
         self._clocks = 0
-        self._last_clock = time.monotonic_ns()
+        self.clock_tracker = ClockTracker()
+        # Deadlines missed by run_scheduled's and run_async's loop, and by
+        # run_async's trigger and LED tasks.
+        self.overruns = 0
+        self.trigger_overruns = 0
+        self.led_overruns = 0
+        # How many times run_idle slept, and for how long each time, and
+        # how many log records it printed instead.
+        self.idle_waits = 0
+        self._idle_ms = 0
+        self.idle_log_records = 0
+        # LED changes requested by the MIDI received since the last update.
+        self._spin = False
+        self._pulse = False
+
+    @property
+    def midi_in(self):
+        """The MIDI input, use its ignore and accept methods to drop
+        messages the loop doesn't need before they're parsed."""
+        return self._midi_in
+
+    @property
+    def idle_time(self):
+        """Seconds that run_idle has spent sleeping instead of running.
+        Time spent printing log records while idle isn't included."""
+        return self.idle_waits * self._idle_ms / 1000
+
+    @micropython.native
+    def _receive_midi(self):
+        # Clock and transport messages go first, ahead of anything queued
+        # up before them.
+        msg = self._midi_in.receive_realtime()
+        if msg is None:
+            msg = self._midi_in.receive()
+        return msg
+
+    @micropython.native
+    def _next_message(self, state):
+        """Receives the next message and updates the state with it."""
+        msg = self._receive_midi()
+        self._process_midi(msg, state)
+        return msg
 
     @micropython.native
     def _process_midi(self, msg, state):
@@ -278,15 +712,17 @@ class Sol:
 
         if msg_type == smolmidi.CLOCK:
             self._clocks += 1
+            # Use the time the clock was received rather than the time it's
+            # handled, so time spent in the queue doesn't skew the tempo.
+            self.clock_tracker.tick(msg.timestamp)
+            if self._clocks % 24 == 0:  # 96 / 4
+                self._pulse = True
+            return
 
-            # Every quarter note, re-calculate the current BPM/clock frequency
-            if self._clocks % 24 == 0:
-                now = time.monotonic_ns()
-                period = now - self._last_clock
-                state.clock_frequency = 60000000000 / period
-                self._last_clock = now
+        # Any other message spins the LED.
+        self._spin = True
 
-        elif msg_type == smolmidi.NOTE_ON:
+        if msg_type == smolmidi.NOTE_ON:
             # Some controllers send note on with velocity 0
             # to signal note off.
             if msg.data[1] == 0:
@@ -314,42 +750,359 @@ class Sol:
         elif msg_type == smolmidi.AFTERTOUCH:
             state._aftertouch[msg.data[0]] = msg.data[1]
 
-        elif msg_type == smolmidi.START or msg_type == smolmidi.CONTINUE:
+        elif msg_type == smolmidi.START:
             state.playing = True
+            self.clock_tracker.start()
+
+        elif msg_type == smolmidi.CONTINUE:
+            state.playing = True
+            self.clock_tracker.resume()
 
         elif msg_type == smolmidi.STOP:
             state.playing = False
             self._clocks = 0
 
-    @micropython.viper
+    @micropython.native
+    def _update_led(self):
+        """Spins or pulses the LED for the MIDI received since the last
+        update."""
+        if self._spin:
+            self._spin = False
+            self.outputs.led.spin()
+        if self._pulse:
+            self._pulse = False
+            self.outputs.led.pulse()
+
+    @micropython.native
+    def _iterate(self, loop, state, msg):
+        """Calls the loop with ``msg`` (a message, or a list of them) and
+        updates the outputs after it. Returns False when the loop stops."""
+        state.clock = self._clocks
+        self._update_led()
+        try:
+            loop(state, msg, self.outputs)
+        except _StopLoop:
+            return False
+        self.outputs.step()
+        self._poll_serial()
+        return True
+
+    @micropython.native
+    def _poll_serial(self):
+        if supervisor.runtime.serial_bytes_available:
+            self._command(sys.stdin.read(1))
+
+    def _command(self, char):
+        """Handles a command character read from the serial console."""
+        if char == "l":
+            self.log.drain()
+        elif self.profiler is not None:
+            self.profiler.command(char)
+
     def run(self, loop):
-        state = State()
-        counter = 0
+        if self.profiler is not None:
+            self._run_profiled(loop)
+        else:
+            self._run(loop)
+
+    @micropython.viper
+    def _run(self, loop):
+        state = State(self.clock_tracker)
+        while self._iterate(loop, state, self._next_message(state)):
+            pass
+
+    @micropython.native
+    def _run_profiled(self, loop):
+        """The same as _run, but timing each phase with the profiler."""
+        state = State(self.clock_tracker)
+        prof = self.profiler
         while True:
-            before = supervisor.ticks_ms()
-            msg = self._midi_in.receive()
+            prof.start()
+            msg = self._receive_midi()
+            prof.mark(profiler.RECEIVE)
 
             self._process_midi(msg, state)
             state.clock = self._clocks
-
-            if msg:
-                if msg.type == smolmidi.CLOCK:
-                    if int(self._clocks) % 24 == 0:  # 96 / 4
-                        self.outputs.led.pulse()
-                else:
-                    self.outputs.led.spin()
+            self._update_led()
+            prof.mark(profiler.PROCESS)
 
             try:
                 loop(state, msg, self.outputs)
             except _StopLoop:
                 break
+            prof.mark(profiler.LOOP)
 
             self.outputs.step()
-            after = supervisor.ticks_ms()
-            stat[counter] = after - before
-            counter += 1
-            if counter > 99:
-                counter = 0
-                stat_sum = sum(stat)/100.0
-                stat_max = max(stat)
-                print(f"total avg {stat_sum:.2f}ms; max {stat_max}ms")
+            prof.mark(profiler.STEP)
+
+            # Reports are printed on request, outside of the timed phases.
+            self._poll_serial()
+
+    @micropython.native
+    def _idle(self, watch):
+        if self.outputs.active:
+            return False
+        for component in watch:
+            if component.active:
+                return False
+        return True
+
+    @micropython.native
+    def run_idle(self, loop, watch=(), idle_ms=1, wake_ms=100):
+        """Like run, but waits instead of calling the loop while nothing
+        is going on.
+
+        The loop is skipped when there's no MIDI message, the outputs
+        have no trigger or LED pulse in progress and none of the
+        components in ``watch`` are ``active``. Pass everything the loop
+        reads that changes over time, such as ADSRs, slew limiters and
+        LFOs (which are always active)::
+
+            sol.run_idle(loop, watch=(adsr, slew))
+
+        While idle, it sleeps ``idle_ms`` at a time and checks for MIDI
+        in between, so a message that arrives during a wait is handled
+        at most ``idle_ms`` later. USB MIDI arrives in 1 ms frames anyway.
+        The loop is still called every ``wake_ms``, for anything it does
+        on a timer of its own. ``idle_waits`` and ``idle_time`` tell how
+        much of the time it slept, ``idle_log_records`` how many log
+        records it printed in place of a sleep.
+        """
+        state = State(self.clock_tracker)
+        log = self.log
+        idle_s = idle_ms / 1000
+        max_waits = max(1, wake_ms // idle_ms)
+        self._idle_ms = idle_ms
+
+        while True:
+            msg = self._next_message(state)
+
+            if msg is None and self._idle(watch):
+                waits = 0
+                records = 0
+                while waits < max_waits:
+                    # Print a log record instead of sleeping, one at a time
+                    # so a message doesn't wait for more than one.
+                    if log.drain(1):
+                        records += 1
+                    else:
+                        time.sleep(idle_s)
+                    waits += 1
+                    msg = self._next_message(state)
+                    if msg is not None:
+                        break
+                self.idle_waits += waits - records
+                self.idle_log_records += records
+
+            if not self._iterate(loop, state, msg):
+                break
+
+    @micropython.native
+    def run_batched(self, loop, budget=32):
+        """Like run, but handles every pending MIDI message each iteration.
+
+        Each iteration drains up to ``budget`` messages into the state and
+        then calls the loop once with all of them, followed by a single
+        output update. Real-time messages (clock and transport) are always
+        drained before anything else. The loop is passed a list of the messages in the
+        order they arrived (possibly empty) instead of a single message::
+
+            def loop(state, messages, outputs):
+                for msg in messages:
+                    ...
+
+        By the time the loop is called the state already reflects every
+        message in the list. The list and its messages are reused on the
+        next iteration, so don't keep references to them.
+        """
+        state = State(self.clock_tracker)
+        storage = [smolmidi.Message() for _ in range(budget)]
+        # Preallocate the list's storage, appending to it later won't grow it.
+        messages = [None] * budget
+
+        while True:
+            del messages[:]
+
+            for n in range(budget):
+                msg = self._next_message(state)
+                if msg is None:
+                    break
+                messages.append(storage[n].copy_from(msg))
+
+            if not self._iterate(loop, state, messages):
+                break
+
+    @micropython.native
+    def run_scheduled(self, loop, rate=1000, budget=32):
+        """Like run_batched, but calls the loop at a fixed rate.
+
+        MIDI is received as often as possible and the state is updated as
+        messages arrive, but the loop and the output update only run
+        ``rate`` times a second (1 kHz by default), however busy the MIDI
+        input is. The loop is called with the messages received since the
+        previous call, in the same way as run_batched. If more than
+        ``budget`` messages arrive in one period, the rest still update the
+        state but aren't in the list.
+
+        Iterations are scheduled against deadlines ``1 / rate`` seconds
+        apart, so time spent in the loop doesn't delay the next iteration.
+        When an iteration runs past the next deadline, the iterations that
+        were missed are skipped instead of run back to back, and counted in
+        ``overruns``.
+        """
+        state = State(self.clock_tracker)
+        storage = [smolmidi.Message() for _ in range(budget)]
+        # Preallocate the list's storage, appending to it later won't grow it.
+        messages = [None] * budget
+        del messages[:]
+        period = 1000000 // rate
+        deadline = smolmidi.ticks_add(smolmidi.ticks_us(), period)
+
+        while True:
+            msg = self._next_message(state)
+            if msg is not None:
+                count = len(messages)
+                if count < budget:
+                    messages.append(storage[count].copy_from(msg))
+
+            if smolmidi.ticks_diff(smolmidi.ticks_us(), deadline) < 0:
+                continue
+
+            if not self._iterate(loop, state, messages):
+                break
+            del messages[:]
+
+            deadline = smolmidi.ticks_add(deadline, period)
+            missed = _missed_periods(deadline, period)
+            if missed:
+                self.overruns += missed
+                deadline = smolmidi.ticks_add(deadline, missed * period)
+
+    def run_async(self, loop, rate=1000, budget=32, trigger_rate=1000, led_rate=50):
+        """Runs the loop with asyncio, as separate tasks for each job.
+
+        * MIDI is received as often as possible and the state is updated
+          as messages arrive, the same way as run_scheduled.
+        * The loop is called ``rate`` times a second with the messages
+          received since the previous call, like run_batched's loop, and
+          the MIDI written to the outputs is sent after it.
+        * Triggers and retriggers are ended ``trigger_rate`` times a
+          second.
+        * The LED is stepped ``led_rate`` times a second, drawing at most
+          at its own frame rate, and serial console commands are handled
+          as often.
+
+        The tasks take turns, so none of them can hold up the others for
+        longer than one pass: a slow LED update never delays handling a
+        note by more than one update. Deadlines that a task misses are
+        skipped instead of run back to back. The loop's are counted in
+        ``overruns``, the trigger task's in ``trigger_overruns`` and the
+        LED task's in ``led_overruns``. This needs the ``asyncio`` library
+        (and ``adafruit_ticks``) from the CircuitPython bundle in ``lib``.
+        """
+        # asyncio is big, only import it when it's used.
+        import asyncio
+
+        asyncio.run(
+            self._run_async(asyncio, loop, rate, budget, trigger_rate, led_rate)
+        )
+
+    async def _run_async(self, asyncio, loop, rate, budget, trigger_rate, led_rate):
+        state = State(self.clock_tracker)
+        storage = [smolmidi.Message() for _ in range(budget)]
+        # Preallocate the list's storage, appending to it later won't grow it.
+        messages = [None] * budget
+        del messages[:]
+
+        tasks = (
+            asyncio.create_task(self._receive_task(asyncio, state, storage, messages)),
+            asyncio.create_task(self._trigger_task(asyncio, trigger_rate)),
+            asyncio.create_task(self._led_task(asyncio, led_rate)),
+        )
+        try:
+            await self._loop_task(asyncio, loop, state, messages, rate)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _receive_task(self, asyncio, state, storage, messages):
+        budget = len(storage)
+        while True:
+            # Drain what's there, then give the other tasks a turn.
+            for _ in range(budget):
+                msg = self._next_message(state)
+                if msg is None:
+                    break
+
+                count = len(messages)
+                if count < budget:
+                    messages.append(storage[count].copy_from(msg))
+
+            await asyncio.sleep(0)
+
+    async def _loop_task(self, asyncio, loop, state, messages, rate):
+        outputs = self.outputs
+        period = 1000000 // rate
+        deadline = smolmidi.ticks_us()
+
+        while True:
+            state.clock = self._clocks
+            try:
+                loop(state, messages, outputs)
+            except _StopLoop:
+                return
+            del messages[:]
+            outputs.midi.flush()
+
+            deadline = smolmidi.ticks_add(deadline, period)
+            missed = _missed_periods(deadline, period)
+            if missed:
+                self.overruns += missed
+                deadline = smolmidi.ticks_add(deadline, missed * period)
+            await _sleep_until(asyncio, deadline)
+
+    async def _trigger_task(self, asyncio, rate):
+        triggers = self.outputs._triggers
+        period = 1000000 // rate
+        deadline = smolmidi.ticks_us()
+        while True:
+            triggers.step()
+            deadline = smolmidi.ticks_add(deadline, period)
+            missed = _missed_periods(deadline, period)
+            if missed:
+                self.trigger_overruns += missed
+                deadline = smolmidi.ticks_add(deadline, missed * period)
+            await _sleep_until(asyncio, deadline)
+
+    async def _led_task(self, asyncio, rate):
+        led = self.outputs.led
+        period = 1000000 // rate
+        deadline = smolmidi.ticks_us()
+        while True:
+            self._update_led()
+            led.step()
+            self._poll_serial()
+            deadline = smolmidi.ticks_add(deadline, period)
+            missed = _missed_periods(deadline, period)
+            if missed:
+                self.led_overruns += missed
+                deadline = smolmidi.ticks_add(deadline, missed * period)
+            await _sleep_until(asyncio, deadline)
+
+
+@micropython.native
+def _missed_periods(deadline, period):
+    """How many periods have passed since ``deadline`` (in
+    smolmidi.ticks_us), counting the one it starts. 0 if it hasn't come
+    yet."""
+    late = smolmidi.ticks_diff(smolmidi.ticks_us(), deadline)
+    if late < 0:
+        return 0
+    return late // period + 1
+
+
+async def _sleep_until(asyncio, deadline):
+    """Sleeps until ``deadline`` (in smolmidi.ticks_us), or just yields to
+    the other tasks if it's already passed."""
+    remaining = smolmidi.ticks_diff(deadline, smolmidi.ticks_us())
+    await asyncio.sleep(remaining / 1000000 if remaining > 0 else 0)
@@ -20,10 +20,153 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import array
+
 import micropython
-import supervisor
+import winterbloom_smolmidi as smolmidi
+
+_MS_TO_US = micropython.const(1000)
+
+
+# What a TriggerScheduler slot is doing.
+_IDLE = micropython.const(0)
+_PULSE = micropython.const(1)
+# Holding the output at its resting value before a queued pulse.
+_GAP = micropython.const(2)
+
+
+class TriggerScheduler:
+    """Times the pulses of any number of triggers and retriggers.
+
+    Each pulse has a deadline in microseconds (smolmidi.ticks_us), after
+    which its output is set back. The scheduler keeps the earliest
+    deadline, so ``step`` doesn't read the clock at all while there are
+    no pulses, and only compares it with that deadline until it's due.
+
+    A pulse started while the last one is still going is queued, up to
+    the slot's ``queue`` size. It starts once the last one has ended and
+    the output has been back at rest for the slot's ``min_gap_us``, so
+    every pulse makes an edge of its own. The queue is a count per slot,
+    queueing never allocates.
+
+    On CircuitPython smolmidi.ticks_us only moves in 1 ms steps, so a
+    pulse ends on the first millisecond tick at or after its deadline.
+    It can be up to 1 ms shorter or longer than its duration, and pulses
+    shorter than 1 ms last anywhere up to a millisecond.
+
+    Triggers and Retriggers made with the same scheduler share it and
+    only need it to be stepped once, Sol's outputs share one for all
+    their gates.
+    """
+
+    def __init__(self):
+        self._outputs = []
+        # The value each output is set to during its pulse.
+        self._pulse_values = bytearray()
+        self._durations = array.array("l")
+        self._gaps = array.array("l")
+        self._queue_sizes = bytearray()
+        self._queued = bytearray()
+        self._states = bytearray()
+        self._deadlines = array.array("l")
+        # Slots that aren't _IDLE.
+        self._count = 0
+        self._next_deadline = 0
+
+    def add(self, output, queue=0, min_gap_us=0):
+        """Adds an output and returns its slot number. This allocates, do
+        it before the loop starts."""
+        self._outputs.append(output)
+        self._pulse_values.append(0)
+        self._durations.append(0)
+        self._gaps.append(min_gap_us)
+        self._queue_sizes.append(queue)
+        self._queued.append(0)
+        self._states.append(_IDLE)
+        self._deadlines.append(0)
+        return len(self._outputs) - 1
+
+    @property
+    def active(self):
+        """Whether any pulse is in progress or queued."""
+        return self._count > 0
+
+    def pending(self, slot):
+        """Whether the output in ``slot`` has a pulse in progress or
+        queued."""
+        return self._states[slot] != _IDLE
+
+    @micropython.native
+    def start(self, slot, value, duration_us):
+        """Sets the output in ``slot`` to ``value`` for ``duration_us``
+        microseconds, then to the opposite value. If a pulse is already in
+        progress, queues this one. Returns False if the queue is full."""
+        self._durations[slot] = duration_us
+        if self._states[slot] != _IDLE:
+            if self._queued[slot] >= self._queue_sizes[slot]:
+                return False
+            self._queued[slot] += 1
+            return True
+
+        self._outputs[slot].value = value
+        self._pulse_values[slot] = value
+        self._states[slot] = _PULSE
+        self._count += 1
+        deadline = smolmidi.ticks_add(smolmidi.ticks_us(), duration_us)
+        self._deadlines[slot] = deadline
+        if (
+            self._count == 1
+            or smolmidi.ticks_diff(deadline, self._next_deadline) < 0
+        ):
+            self._next_deadline = deadline
+        return True
+
+    @micropython.native
+    def cancel(self, slot):
+        """Drops the pulse in progress in ``slot`` and any queued ones,
+        leaving the output as it is."""
+        self._queued[slot] = 0
+        if self._states[slot] != _IDLE:
+            self._states[slot] = _IDLE
+            self._count -= 1
+
+    @micropython.native
+    def step(self):
+        """Ends every pulse that's due and starts queued ones."""
+        if not self._count:
+            return
+        now = smolmidi.ticks_us()
+        if smolmidi.ticks_diff(now, self._next_deadline) < 0:
+            return
 
-_MS_TO_S = micropython.const(1000)
+        states = self._states
+        deadlines = self._deadlines
+        next_deadline = now
+        found = False
+        for slot in range(len(states)):
+            state = states[slot]
+            if state == _IDLE:
+                continue
+            deadline = deadlines[slot]
+            if smolmidi.ticks_diff(now, deadline) >= 0:
+                if state == _GAP:
+                    self._outputs[slot].value = bool(self._pulse_values[slot])
+                    states[slot] = _PULSE
+                    deadline = smolmidi.ticks_add(now, self._durations[slot])
+                else:
+                    self._outputs[slot].value = not self._pulse_values[slot]
+                    if not self._queued[slot]:
+                        states[slot] = _IDLE
+                        self._count -= 1
+                        continue
+                    self._queued[slot] -= 1
+                    states[slot] = _GAP
+                    deadline = smolmidi.ticks_add(now, self._gaps[slot])
+                deadlines[slot] = deadline
+            if not found or smolmidi.ticks_diff(deadline, next_deadline) < 0:
+                next_deadline = deadline
+                found = True
+        self._next_deadline = next_deadline
 
 
 class Trigger:
@@ -43,38 +186,47 @@ class Trigger:
 
         while True:
             trigger.step()
+
+    The pulse is timed in microseconds, so ``duration_ms`` can be a
+    fraction, but see TriggerScheduler for the clock's 1 ms resolution on
+    the device. Triggering again while a pulse is in progress queues up to
+    ``queue`` more pulses, each one after the output has been low for
+    ``min_gap_ms``. ``trigger`` only returns False when the queue is full.
+    Pass a TriggerScheduler to share one with other triggers, and step
+    that instead of each trigger.
     """
 
-    def __init__(self, output, duration_ms=15):
+    def __init__(
+        self, output, duration_ms=15, scheduler=None, queue=2, min_gap_ms=2
+    ):
         self._output = output
         self._duration = duration_ms
-        self._start_time = None
+        self._scheduler = scheduler or TriggerScheduler()
+        self._slot = self._scheduler.add(
+            output, queue=queue, min_gap_us=int(min_gap_ms * _MS_TO_US)
+        )
 
     def trigger(self, duration_ms=None):
-        # TODO: Figure out what to do if the trigger
-        # phase is still on-going.
-        if self._start_time is not None:
-            return False
-
         if duration_ms:
             self._duration = duration_ms
 
-        self._output.value = True
-        self._start_time = supervisor.ticks_ms()
-
-        return True
+        return self._scheduler.start(
+            self._slot, True, int(self._duration * _MS_TO_US)
+        )
 
     __call__ = trigger
 
-    def step(self):
-        if self._start_time is None:
-            return
+    def cancel(self):
+        """Drops the trigger in progress and any queued ones."""
+        self._scheduler.cancel(self._slot)
+
+    @property
+    def active(self):
+        """Whether a trigger is in progress."""
+        return self._scheduler.pending(self._slot)
 
-        now = supervisor.ticks_ms()
-        elapsed_ms = now - self._start_time
-        if elapsed_ms > self._duration:
-            self._output.value = False
-            self._start_time = None
+    def step(self):
+        self._scheduler.step()
 
 
 class Retrigger:
@@ -95,41 +247,50 @@ class Retrigger:
 
         while True:
             retrigger.step()
+
+    As with Trigger, ``duration_ms`` can be a fraction, retriggers are
+    queued (after the output has been high for ``min_gap_ms``) and a
+    TriggerScheduler can be shared.
     """
 
-    def __init__(self, output, duration_ms=15):
+    def __init__(
+        self, output, duration_ms=15, scheduler=None, queue=2, min_gap_ms=2
+    ):
         self._output = output
         self._duration = duration_ms
-        self._start_time = None
+        self._scheduler = scheduler or TriggerScheduler()
+        self._slot = self._scheduler.add(
+            output, queue=queue, min_gap_us=int(min_gap_ms * _MS_TO_US)
+        )
 
     def retrigger(self, duration_ms=None):
-        # TODO: Figure out what to do if the trigger
-        # phase is still on-going.
-        if self._start_time is not None:
-            return False
-
         # If the value is already low, no need to
         # "retrigger"- just set the output to high
         # and return.
-        if self._output.value is False:
+        if (
+            not self._scheduler.pending(self._slot)
+            and self._output.value is False
+        ):
             self._output.value = True
             return True
 
         if duration_ms:
             self._duration = duration_ms
 
-        self._output.value = False
-        self._start_time = supervisor.ticks_ms()
-        return True
+        return self._scheduler.start(
+            self._slot, False, int(self._duration * _MS_TO_US)
+        )
 
     __call__ = retrigger
 
-    def step(self):
-        if self._start_time is None:
-            return
+    def cancel(self):
+        """Drops the retrigger in progress and any queued ones."""
+        self._scheduler.cancel(self._slot)
 
-        now = supervisor.ticks_ms()
-        elapsed_ms = now - self._start_time
-        if elapsed_ms > self._duration:
-            self._output.value = True
-            self._start_time = None
+    @property
+    def active(self):
+        """Whether a retrigger is in progress."""
+        return self._scheduler.pending(self._slot)
+
+    def step(self):
+        self._scheduler.step()
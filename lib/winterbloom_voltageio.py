@@ -173,7 +173,7 @@ class VoltageOut:
         high_val = self._calibration[high]
 
         lerped = round(low_val + ((high_val - low_val) * normalized_offset))
-        return min(lerped, 65535)
+        return lerped if lerped < 65535 else 65535
 
     def _get_voltage(self):
         return self._voltage
@@ -0,0 +1,15 @@
+"""A host-side simulator for the Sol firmware in ``lib/``.
+
+Runs winterbloom_sol (and a loop such as rplktrlib.RedBlue.update) on
+CPython against stand-ins for the CircuitPython hardware modules, driven
+by a virtual clock, so hours of MIDI can be pushed through the firmware
+in seconds. See Simulator, or run a MIDI file through RedBlue with::
+
+    python -m solsim song.mid
+"""
+
+from solsim.clock import VirtualClock
+from solsim.midifile import read_midi_file
+from solsim.simulator import Simulator
+
+__all__ = ["read_midi_file", "Simulator", "VirtualClock"]
@@ -0,0 +1,81 @@
+"""Runs a MIDI file through rplktrlib.RedBlue on the simulated Sol."""
+
+import argparse
+import contextlib
+import csv
+import os
+import time
+
+from solsim import Simulator, read_midi_file
+from solsim.redblue import red_blue_loop, repeat_events
+from solsim.simulator import MODES
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m solsim", description=__doc__)
+    parser.add_argument("midi_file", help="a Standard MIDI File to play")
+    parser.add_argument("--mode", choices=MODES, default="run")
+    parser.add_argument(
+        "--iteration-us",
+        type=int,
+        default=500,
+        help="simulated time each loop iteration takes (default: 500)",
+    )
+    parser.add_argument(
+        "--poll-us",
+        type=int,
+        default=20,
+        help="simulated time each MIDI port read takes (default: 20)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="play the file this many times"
+    )
+    parser.add_argument("--csv", help="write the DAC codes and gate edges here")
+    parser.add_argument(
+        "--verbose", action="store_true", help="show what the firmware prints"
+    )
+    args = parser.parse_args()
+
+    events = repeat_events(read_midi_file(args.midi_file), args.repeat)
+    sim = Simulator(events, iteration_us=args.iteration_us, poll_us=args.poll_us)
+
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        sol = sim.sol()
+        loop, options = red_blue_loop(sol, args.mode)
+        sim.run(sol, loop, mode=args.mode, **options)
+    elapsed = time.perf_counter() - start
+
+    simulated = sim.clock.now_us / 1000000
+    print("messages      {}".format(len(events)))
+    print("simulated     {:.1f} s".format(simulated))
+    print("wall clock    {:.1f} s ({:.0f}x)".format(elapsed, simulated / elapsed))
+    print("iterations    {}".format(sim.iterations))
+    print("DAC writes    {} ({} changes)".format(sim.dac_writes, len(sim.dac_codes)))
+    print("gate edges    {}".format(len(sim.gate_edges)))
+    print("LED writes    {}".format(sim.led_writes))
+    if args.mode == "run_idle":
+        print(
+            "idle          {:.1f} s ({:.0%})".format(
+                sol.idle_time, sol.idle_time / simulated
+            )
+        )
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("time_us", "output", "value"))
+            rows = [(t, "cv_" + channel, code) for t, channel, code in sim.dac_codes]
+            rows += [
+                (t, "gate_{}".format(gate), int(value))
+                for t, gate, value in sim.gate_edges
+            ]
+            rows.sort(key=lambda row: row[0])
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
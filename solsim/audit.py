@@ -0,0 +1,382 @@
+"""Finds the lines of the firmware that allocate memory in the run loop.
+
+Plays a MIDI file through RedBlue on the simulated Sol and reports every
+line in ``lib/`` that allocated, with how many times per iteration it did::
+
+    python -m solsim.audit song.mid
+    python -m solsim.audit song.mid --max-per-iteration 0
+
+The first ``--warmup`` iterations aren't audited, so one-off allocations
+while things get going don't count. With ``--max-per-iteration``, the exit
+status is 1 if the loop allocates more often than that.
+
+Allocations are found with tracemalloc: after each line runs, and after
+each call it makes, its peak memory use tells if it allocated. This needs
+sys.monitoring (Python 3.12 or later), which doesn't materialize frame
+objects the way sys.settrace does.
+
+CPython also allocates where the device doesn't: it boxes every float and
+int, which CircuitPython only does for ints of 2**30 or more, and puts the
+iterators of ``for`` and ``with`` statements on the heap instead of the
+stack. So each allocation is classified by the type of object it was
+for, and the ones that are only numbers are counted as host-only and only
+shown with ``--host``. An allocation is made on the device too if:
+
+* its line builds a tuple, list, dict, set, slice, string or function
+  (a ``BUILD_*``, ``FORMAT_VALUE``, ``MAKE_FUNCTION`` or similar
+  instruction). CPython takes small tuples and lists from free lists that
+  tracemalloc doesn't see, so these lines count every time they run,
+  whatever tracemalloc says,
+* it follows a call to a class other than int, float and bool, or to a
+  builtin that returns something other than a number, or
+* its line gets an int of 2**30 or more back from a function, or runs with
+  one in a local variable.
+
+Anything else on the line is taken to be arithmetic on numbers. Lines with
+a ``for`` or ``with`` statement are host-only. A big int that's only used
+in the middle of an expression, and a string or tuple made with ``+``, are
+missed.
+"""
+
+import argparse
+import builtins
+import collections
+import contextlib
+import dis
+import linecache
+import math
+import os
+import sys
+import tracemalloc
+import types
+
+from solsim import Simulator, read_midi_file
+from solsim.redblue import red_blue_loop, repeat_events
+from solsim.simulator import LIB, MODES
+
+# The range of CircuitPython's small ints. An int of 2**30 or more is boxed
+# on the device as well.
+_SMALL_INT_MIN = -(1 << 30)
+_SMALL_INT_MAX = (1 << 30) - 1
+# Instructions that make CPython allocate an iterator or a bound __exit__.
+_HOST_OPCODES = frozenset(("GET_ITER", "BEFORE_WITH"))
+# Instructions that make a new container, string or function, which the
+# device allocates as well.
+_DEVICE_OPCODES = frozenset(
+    (
+        "BUILD_TUPLE",
+        "BUILD_LIST",
+        "BUILD_SET",
+        "BUILD_MAP",
+        "BUILD_CONST_KEY_MAP",
+        "BUILD_STRING",
+        "BUILD_SLICE",
+        "BINARY_SLICE",
+        "FORMAT_VALUE",
+        "LIST_APPEND",
+        "LIST_EXTEND",
+        "SET_ADD",
+        "SET_UPDATE",
+        "MAP_ADD",
+        "DICT_MERGE",
+        "DICT_UPDATE",
+        "MAKE_FUNCTION",
+        "LOAD_BUILD_CLASS",
+    )
+)
+# Classes whose instances are numbers.
+_NUMBER_TYPES = (int, float, bool)
+# Builtins that return numbers or existing objects, so anything CPython
+# allocates in them is a boxed number. Functions from math are as well.
+_NUMBER_BUILTINS = frozenset(
+    ("abs", "round", "min", "max", "len", "isinstance", "hasattr", "getattr", "next")
+)
+
+
+class AllocationAuditor:
+    """Records which lines of the code in ``root`` allocate memory between
+    ``start`` and ``stop``."""
+
+    def __init__(self, root=LIB):
+        self.root = root
+        # (filename, line number) -> how many times the line allocated.
+        self.counts = collections.Counter()
+        # The same, for allocations that the device wouldn't make.
+        self.host_counts = collections.Counter()
+        # (filename, line number) -> the most it allocated at once, in bytes,
+        # as far as tracemalloc could see.
+        self.sizes = {}
+        self.iterations = 0
+        self._location = None
+        self._base = 0
+        self._stack = []
+        # Whether the code that ran since the last event was a call that
+        # allocates an object on the device.
+        self._device_call = False
+        # Code object -> its lines with a _HOST_OPCODES instruction, and its
+        # lines with a _DEVICE_OPCODES instruction.
+        self._host_lines = {}
+        self._device_lines = {}
+
+    def start(self):
+        monitoring = sys.monitoring
+        tool = monitoring.PROFILER_ID
+        events = monitoring.events
+        tracemalloc.start()
+        monitoring.use_tool_id(tool, "solsim.audit")
+        monitoring.register_callback(tool, events.LINE, self._on_line)
+        for event in (events.PY_START, events.PY_RESUME):
+            monitoring.register_callback(tool, event, self._on_enter)
+        for event in (events.PY_RETURN, events.PY_YIELD):
+            monitoring.register_callback(tool, event, self._on_leave)
+        monitoring.register_callback(tool, events.PY_UNWIND, self._on_unwind)
+        monitoring.register_callback(tool, events.CALL, self._on_call)
+        monitoring.set_events(
+            tool,
+            events.LINE
+            | events.CALL
+            | events.PY_START
+            | events.PY_RESUME
+            | events.PY_RETURN
+            | events.PY_YIELD
+            | events.PY_UNWIND,
+        )
+        self._restart()
+
+    def stop(self):
+        monitoring = sys.monitoring
+        monitoring.set_events(monitoring.PROFILER_ID, 0)
+        monitoring.free_tool_id(monitoring.PROFILER_ID)
+        tracemalloc.stop()
+
+    def _account(self, argument, big_int=False):
+        """Charges whatever was allocated since the last event to the line
+        that was running. ``argument`` is the callback's int argument, which
+        sys.monitoring allocated unless it's a cached small int. With
+        ``big_int``, the line made an int that the device allocates too."""
+        _, peak = tracemalloc.get_traced_memory()
+        location = self._location
+        device_call = self._device_call
+        self._device_call = False
+        if location is None:
+            return
+        size = peak - self._base
+        if argument > 256:
+            # A whole PyLongObject, padded to 8 bytes.
+            size -= (sys.getsizeof(argument) + 7) & ~7
+        if size <= 0 and not big_int:
+            return
+        code = location[2]
+        if location[1] in self._device_lines[code]:
+            # Already counted when the line started.
+            self._charge(location, size, count=False)
+            return
+        if not big_int and (
+            location[1] in self._host_lines[code]
+            or not (device_call or self._holds_big_int(code))
+        ):
+            self.host_counts[location[:2]] += 1
+            return
+        self._charge(location, size)
+
+    def _charge(self, location, size, count=True):
+        location = location[:2]
+        if count:
+            self.counts[location] += 1
+        if size >= self.sizes.get(location, 0):
+            self.sizes[location] = size
+
+    def _holds_big_int(self, code):
+        """Whether the running frame of ``code`` has an int of 2**30 or
+        more in a local variable."""
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_code is not code:
+            frame = frame.f_back
+        if frame is None:
+            return False
+        for value in frame.f_locals.values():
+            if _is_big_int(value):
+                return True
+        return False
+
+    def _restart(self):
+        # Everything the callbacks allocated is done by now.
+        self._base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def _on_line(self, code, line_number):
+        self._account(line_number)
+        if not code.co_filename.startswith(self.root):
+            self._location = None
+            self._restart()
+            return sys.monitoring.DISABLE
+        if code not in self._host_lines:
+            instructions = list(dis.get_instructions(code))
+            self._host_lines[code] = frozenset(
+                instruction.positions.lineno
+                for instruction in instructions
+                if instruction.opname in _HOST_OPCODES
+            )
+            self._device_lines[code] = (
+                frozenset(
+                    instruction.positions.lineno
+                    for instruction in instructions
+                    if instruction.opname in _DEVICE_OPCODES
+                )
+                - self._host_lines[code]
+            )
+        self._location = (code.co_filename, line_number, code)
+        if line_number in self._device_lines[code]:
+            # CPython takes small tuples and lists from free lists, which
+            # tracemalloc doesn't see, so these lines count every time.
+            self._charge(self._location, 0)
+        self._restart()
+
+    def _on_enter(self, code, offset):
+        self._account(offset)
+        self._stack.append(self._location)
+        self._location = None
+        self._restart()
+
+    def _on_leave(self, code, offset, value):
+        big_int = _is_big_int(value)
+        self._account(offset, big_int)
+        returned_from_firmware = self._location is not None
+        # Back to the line that made the call.
+        self._location = self._stack.pop() if self._stack else None
+        # An int of 2**30 or more from outside the firmware, such as
+        # time.monotonic_ns, is allocated by the line that called for it.
+        if big_int and not returned_from_firmware and self._location is not None:
+            self._charge(self._location, sys.getsizeof(value))
+        self._restart()
+
+    def _on_unwind(self, code, offset, exception):
+        self._on_leave(code, offset, exception)
+
+    def _on_call(self, code, offset, function, argument):
+        self._account(offset)
+        # Python functions' own lines are audited, classes and builtins are
+        # judged by what they return.
+        location = self._location
+        if location is not None and location[2] is code:
+            self._device_call = _allocates_object(function)
+        self._restart()
+
+    def audited(self, loop, warmup=100):
+        """Wraps a Sol loop function so that the audit starts after
+        ``warmup`` iterations and counts the iterations after that."""
+
+        def audited_loop(*args):
+            loop(*args)
+            if self.iterations or warmup <= 0:
+                self.iterations += 1
+            else:
+                warmup_left[0] -= 1
+                if not warmup_left[0]:
+                    self.start()
+                    self.iterations = 1
+
+        warmup_left = [warmup]
+        if warmup <= 0:
+            self.start()
+        return audited_loop
+
+    def per_iteration(self, host=False):
+        """How many times per iteration something allocated."""
+        total = sum(self.counts.values())
+        if host:
+            total += sum(self.host_counts.values())
+        return total / max(self.iterations, 1)
+
+    def report(self, host=False, file=None):
+        file = file or sys.stdout
+        counts = collections.Counter(self.counts)
+        if host:
+            counts.update(self.host_counts)
+        root = os.path.dirname(self.root)
+        print(
+            "{} iterations, {:.2f} allocations per iteration".format(
+                self.iterations, self.per_iteration(host)
+            ),
+            file=file,
+        )
+        for (filename, line_number), count in counts.most_common():
+            print(
+                "{:>10.3f}/it {:>6} B  {}:{}  {}".format(
+                    count / max(self.iterations, 1),
+                    self.sizes.get((filename, line_number), "host"),
+                    os.path.relpath(filename, root),
+                    line_number,
+                    linecache.getline(filename, line_number).strip(),
+                ),
+                file=file,
+            )
+
+
+def _allocates_object(function):
+    """Whether calling ``function`` makes an object that isn't a number."""
+    if isinstance(function, (types.FunctionType, types.MethodType)):
+        return False
+    if isinstance(function, type):
+        return not issubclass(function, _NUMBER_TYPES)
+    if getattr(function, "__self__", None) is builtins:
+        return function.__name__ not in _NUMBER_BUILTINS
+    return getattr(function, "__module__", None) != "math"
+
+
+def _is_big_int(value):
+    return value.__class__ is int and not (
+        _SMALL_INT_MIN <= value <= _SMALL_INT_MAX
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m solsim.audit", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("midi_file", help="a Standard MIDI File to play")
+    parser.add_argument("--mode", choices=MODES, default="run")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=100,
+        help="iterations to run before auditing (default: 100)",
+    )
+    parser.add_argument(
+        "--host",
+        action="store_true",
+        help="also count allocations that only happen on the host",
+    )
+    parser.add_argument(
+        "--max-per-iteration",
+        type=float,
+        help="fail if there are more allocations per iteration than this",
+    )
+    args = parser.parse_args()
+
+    if not hasattr(sys, "monitoring"):
+        parser.exit(2, "solsim.audit needs Python 3.12 or later\n")
+
+    sim = Simulator(repeat_events(read_midi_file(args.midi_file), args.repeat))
+    auditor = AllocationAuditor()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        sol = sim.sol()
+        loop, options = red_blue_loop(sol, args.mode)
+        loop = auditor.audited(loop, warmup=args.warmup)
+        try:
+            sim.run(sol, loop, mode=args.mode, **options)
+        finally:
+            if auditor.iterations:
+                auditor.stop()
+
+    auditor.report(host=args.host)
+    if (
+        args.max_per_iteration is not None
+        and auditor.per_iteration(args.host) > args.max_per_iteration
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""The simulator's virtual clock."""
+
+from solsim import hardware
+
+# CircuitPython's supervisor.ticks_ms wraps around at 2 ** 29.
+_TICKS_MS_MAX = (1 << 29) - 1
+
+
+class VirtualClock:
+    """A clock that only moves when it's told to.
+
+    Stands in for the ``time`` module in the firmware modules and drives
+    every other time source in the simulated hardware, so simulated time
+    is independent of how fast the host runs the firmware.
+    """
+
+    def __init__(self, start_us=0):
+        self.now_us = start_us
+
+    def advance(self, us):
+        self.now_us += us
+
+    def advance_to(self, us):
+        if us > self.now_us:
+            self.now_us = us
+
+    # The parts of the time module the firmware uses. On CircuitPython
+    # monotonic_ns returns a long int and monotonic a float, so both
+    # allocate and raise MemoryError while the heap is locked.
+
+    def monotonic_ns(self):
+        _check_heap("time.monotonic_ns")
+        return self.now_us * 1000
+
+    def monotonic(self):
+        _check_heap("time.monotonic")
+        return self.now_us / 1000000
+
+    def sleep(self, seconds):
+        self.advance(int(seconds * 1000000))
+
+    def ticks_ms(self):
+        return (self.now_us // 1000) & _TICKS_MS_MAX
+
+
+def _check_heap(name):
+    if hardware.heap_locked():
+        raise MemoryError("{} allocates, but the heap is locked".format(name))
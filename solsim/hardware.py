@@ -0,0 +1,343 @@
+"""Stand-ins for the CircuitPython modules the firmware imports.
+
+``install`` puts them into ``sys.modules`` so that importing the firmware
+from ``lib/`` picks them up instead of the real (or the .mpy) modules.
+Everything they do is reported to the simulator that installed them.
+"""
+
+import struct
+import sys
+import types
+
+# Set by install, the Simulator that's recording the hardware.
+_sim = None
+
+_WRITE_AND_UPDATE_DAC = 0b00110000
+# The DAC channel bits of the AD5686, Sol's DAC, in the write command.
+_DAC_CHANNELS = {0b0001: "a", 0b0010: "b", 0b0100: "c", 0b1000: "d"}
+_GATE_PINS = {"G1": 1, "G2": 2, "G3": 3, "G4": 4}
+
+# Nominal calibration for the -5 V to +8 V outputs, stored in NVM the way
+# _calibration.write_calibration_to_nvm does it.
+_CALIBRATION = "calibration = {}".format(
+    repr({channel: {-5.0: 0, 8.0: 65535} for channel in "abcd"})
+).encode("utf-8")
+
+
+# micropython
+
+
+def _passthrough(function):
+    return function
+
+
+def _const(value):
+    return value
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+# How many times heap_lock has been called without heap_unlock.
+_heap_locks = 0
+
+
+def _heap_lock():
+    global _heap_locks
+    _heap_locks += 1
+
+
+def _heap_unlock():
+    global _heap_locks
+    _heap_locks -= 1
+    return _heap_locks
+
+
+def heap_locked():
+    """Whether the firmware has locked the heap, so allocating would raise
+    MemoryError on the device."""
+    return _heap_locks > 0
+
+
+# board
+
+
+class _Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "board.{}".format(self.name)
+
+
+_PINS = (
+    "NEOPIXEL",
+    "DAC_CS",
+    "G1",
+    "G2",
+    "G3",
+    "G4",
+    "SCK",
+    "MOSI",
+    "MISO",
+    "TX",
+    "RX",
+)
+
+
+# digitalio
+
+
+class Direction:
+    INPUT = 0
+    OUTPUT = 1
+
+
+class DigitalInOut:
+    """Records every change of a gate output's value."""
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self._value = False
+        self._gate = _GATE_PINS.get(pin.name)
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        value = bool(value)
+        if value != self._value and self._gate is not None and _sim.record:
+            _sim.gate_edges.append((_sim.clock.now_us, self._gate, value))
+        self._value = value
+
+    def deinit(self):
+        pass
+
+
+# neopixel
+
+
+class NeoPixel:
+    def __init__(self, pin, n, pixel_order=None, brightness=1.0, auto_write=True):
+        self._pixels = [(0, 0, 0)] * n
+        self.brightness = brightness
+
+    def __setitem__(self, index, value):
+        _sim.led_writes += 1
+        self._pixels[index] = value
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def __len__(self):
+        return len(self._pixels)
+
+    def show(self):
+        pass
+
+
+# supervisor
+
+
+class _Runtime:
+    serial_bytes_available = False
+    autoreload = True
+
+
+def _supervisor_ticks_ms():
+    return _sim.clock.ticks_ms()
+
+
+# usb_midi and busio
+
+
+class PortIn:
+    """A MIDI input that's fed from the simulator's script.
+
+    Each read costs the simulator's ``poll_us`` and first takes every
+    scripted message that's due by then.
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+
+    def feed(self, data):
+        self._pending += data
+
+    def readinto(self, buf, nbytes=None):
+        _sim.clock.advance(_sim.poll_us)
+        _sim.deliver()
+        if nbytes is None:
+            nbytes = len(buf)
+        count = min(nbytes, len(self._pending))
+        buf[:count] = self._pending[:count]
+        del self._pending[:count]
+        return count
+
+
+class PortOut:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        self.written += nbytes
+        return nbytes
+
+
+class SPI:
+    def __init__(self, clock, MOSI=None, MISO=None):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class UART(PortIn):
+    """A serial MIDI input, fed the same way as the USB port."""
+
+    def __init__(self, tx=None, rx=None, baudrate=9600, timeout=1, **kwargs):
+        super().__init__()
+
+    @property
+    def in_waiting(self):
+        _sim.deliver()
+        return len(self._pending)
+
+    def readinto(self, buf):
+        return super().readinto(buf) or None
+
+
+# adafruit_bus_device.spi_device
+
+
+class SPIDevice:
+    """Decodes the AD5686 commands written to the DAC."""
+
+    def __init__(self, spi, chip_select=None, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write(self, buf, start=0, end=None):
+        command = buf[start]
+        if command & 0xF0 != _WRITE_AND_UPDATE_DAC:
+            return
+        if not _sim.record:
+            _sim.dac_writes += 1
+            return
+        code = buf[start + 1] << 8 | buf[start + 2]
+        _sim.dac_write(_DAC_CHANNELS[command & 0x0F], code)
+
+
+# analogio
+
+
+class AnalogOut:
+    def __init__(self, pin):
+        self.value = 0
+
+
+class AnalogIn:
+    def __init__(self, pin):
+        self.value = 0
+        self.reference_voltage = 3.3
+
+
+# adafruit_ticks
+
+
+_TICKS_PERIOD = 1 << 29
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def _ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def _ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    return ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def _ticks_less(ticks1, ticks2):
+    return _ticks_diff(ticks1, ticks2) < 0
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install(sim):
+    """Installs the stand-in modules, reporting to ``sim``.
+
+    The modules are only created once, since the firmware keeps references
+    to them, later calls switch them over to the new simulator.
+    """
+    global _sim, _heap_locks
+    _sim = sim
+    _heap_locks = 0
+
+    usb_midi = sys.modules.get("usb_midi")
+    if usb_midi is not None and isinstance(usb_midi.ports[0], PortIn):
+        usb_midi.ports[0]._pending = bytearray()
+        return
+
+    _module(
+        "micropython",
+        const=_const,
+        native=_passthrough,
+        viper=_passthrough,
+        opt_level=_noop,
+        heap_lock=_heap_lock,
+        heap_unlock=_heap_unlock,
+        mem_info=_noop,
+        alloc_emergency_exception_buf=_noop,
+    )
+    _module("board", **{name: _Pin(name) for name in _PINS})
+    _module("digitalio", Direction=Direction, DigitalInOut=DigitalInOut)
+    _module("neopixel", NeoPixel=NeoPixel)
+    _module(
+        "supervisor",
+        runtime=_Runtime(),
+        ticks_ms=_supervisor_ticks_ms,
+        reload=_noop,
+    )
+    _module("usb_midi", ports=(PortIn(), PortOut()))
+    _module("busio", SPI=SPI, UART=UART)
+    _module("analogio", AnalogOut=AnalogOut, AnalogIn=AnalogIn)
+    bus_device = _module("adafruit_bus_device")
+    bus_device.spi_device = _module(
+        "adafruit_bus_device.spi_device", SPIDevice=SPIDevice
+    )
+    _module(
+        "adafruit_ticks",
+        ticks_ms=_supervisor_ticks_ms,
+        ticks_add=_ticks_add,
+        ticks_diff=_ticks_diff,
+        ticks_less=_ticks_less,
+    )
+
+    nvm = bytearray(4096)
+    nvm[0:2] = b"\x69\x69"
+    nvm[2:4] = struct.pack("H", len(_CALIBRATION))
+    nvm[4 : 4 + len(_CALIBRATION)] = _CALIBRATION
+    _module(
+        "microcontroller",
+        nvm=nvm,
+        cpu=types.SimpleNamespace(uid=bytes(8)),
+        reset=_noop,
+    )
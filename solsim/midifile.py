@@ -0,0 +1,114 @@
+"""Reads Standard MIDI Files into timed messages for the simulator."""
+
+import struct
+
+# Bytes of data after each channel message's status byte, by type.
+_DATA_LENGTHS = {
+    0x80: 2,
+    0x90: 2,
+    0xA0: 2,
+    0xB0: 2,
+    0xC0: 1,
+    0xD0: 1,
+    0xE0: 2,
+}
+_DEFAULT_TEMPO = 500000  # microseconds per quarter note, 120 BPM
+_SET_TEMPO = 0x51
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _read_track(data, number):
+    """Yields (tick, order, message) for a track's MIDI messages and
+    (tick, order, tempo) for its tempo changes."""
+    tick = 0
+    pos = 0
+    running_status = 0
+    order = 0
+    while pos < len(data):
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        order += 1
+        status = data[pos]
+
+        if status == 0xFF:
+            meta_type = data[pos + 1]
+            length, pos = _read_varlen(data, pos + 2)
+            if meta_type == _SET_TEMPO:
+                tempo = int.from_bytes(data[pos : pos + 3], "big")
+                yield tick, (number, order), tempo
+            pos += length
+            continue
+
+        if status == 0xF0 or status == 0xF7:
+            length, pos = _read_varlen(data, pos + 1)
+            payload = bytes(data[pos : pos + length])
+            pos += length
+            # F7 events are sent as they are, they're used for escapes and
+            # for sysex messages split into packets.
+            if status == 0xF0:
+                payload = bytes((status,)) + payload
+            yield tick, (number, order), payload
+            continue
+
+        if status & 0x80:
+            running_status = status
+            pos += 1
+        elif not running_status:
+            raise ValueError(
+                "Data byte without a status byte in track {}".format(number)
+            )
+
+        length = _DATA_LENGTHS[running_status & 0xF0]
+        message = bytes((running_status,)) + bytes(data[pos : pos + length])
+        pos += length
+        yield tick, (number, order), message
+
+
+def read_midi_file(path):
+    """Returns the messages in a Standard MIDI File as a list of
+    ``(time_us, message_bytes)`` tuples, in order, following the file's
+    tempo changes."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if data[:4] != b"MThd":
+        raise ValueError("{} isn't a Standard MIDI File".format(path))
+    header_length = struct.unpack(">I", data[4:8])[0]
+    _, track_count, division = struct.unpack(">HHH", data[8:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division isn't supported")
+
+    events = []
+    pos = 8 + header_length
+    for number in range(track_count):
+        chunk_type = data[pos : pos + 4]
+        length = struct.unpack(">I", data[pos + 4 : pos + 8])[0]
+        pos += 8
+        if chunk_type == b"MTrk":
+            events.extend(_read_track(data[pos : pos + length], number))
+        pos += length
+
+    # Tempo changes apply to every track, so convert ticks to time in the
+    # order of the merged tracks.
+    events.sort(key=lambda event: (event[0], event[1]))
+    result = []
+    tempo = _DEFAULT_TEMPO
+    last_tick = 0
+    time_us = 0.0
+    for tick, _, payload in events:
+        time_us += (tick - last_tick) * tempo / division
+        last_tick = tick
+        if isinstance(payload, int):
+            tempo = payload
+        else:
+            result.append((int(time_us), payload))
+    return result
@@ -0,0 +1,34 @@
+"""Runs rplktrlib.RedBlue on the simulated Sol, the way code.py does."""
+
+
+def red_blue_loop(sol, mode="run"):
+    """Creates a RedBlue for ``sol`` and returns a loop function for the
+    Sol ``mode`` it's going to be run with, and the extra arguments for
+    the mode."""
+    from rplktrlib import RedBlue
+
+    red_blue = RedBlue()
+    red_blue.configure_midi(sol.midi_in)
+    if mode == "run":
+        return red_blue.update, {}
+    if mode == "run_idle":
+        return red_blue.update, {"watch": (red_blue,)}
+
+    # RedBlue handles one message per call.
+    def loop(state, messages, outputs):
+        for msg in messages:
+            red_blue.update(state, msg, outputs)
+        if not messages:
+            red_blue.update(state, None, outputs)
+
+    return loop, {}
+
+
+def repeat_events(events, times):
+    """Plays ``events`` back to back ``times`` times."""
+    length = events[-1][0] + 1 if events else 0
+    return [
+        (time_us + length * n, message)
+        for n in range(times)
+        for time_us, message in events
+    ]
@@ -0,0 +1,179 @@
+"""Runs the firmware in ``lib/`` against simulated hardware."""
+
+import asyncio
+import math
+import os
+import selectors
+import sys
+import time
+
+from solsim import hardware
+from solsim.clock import VirtualClock
+
+LIB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+
+MODES = ("run", "run_idle", "run_batched", "run_scheduled", "run_async")
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """Moves the clock forward instead of blocking."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if not ready and timeout:
+            self._clock.advance(math.ceil(timeout * 1000000))
+        return ready
+
+
+class _VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """An asyncio event loop that runs on the simulator's clock, so that
+    sleeping tasks wake up in simulated time."""
+
+    def __init__(self, clock):
+        super().__init__(_VirtualTimeSelector(clock))
+        self._virtual_clock = clock
+
+    def time(self):
+        return self._virtual_clock.now_us / 1000000
+
+
+class _VirtualTimePolicy(asyncio.DefaultEventLoopPolicy):
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def new_event_loop(self):
+        return _VirtualTimeEventLoop(self._clock)
+
+
+class Simulator:
+    """Feeds timed MIDI messages into Sol and records what it outputs.
+
+    ``events`` is a list of ``(time_us, message_bytes)`` tuples, written
+    out by hand or read from a file with read_midi_file::
+
+        sim = Simulator([(0, b"\\x90\\x3c\\x64"), (500000, b"\\x80\\x3c\\x00")])
+        sol = sim.sol()
+        sim.run(sol, loop)
+        print(sim.dac_codes, sim.gate_edges)
+
+    Time is simulated: every call of the loop moves the clock forward by
+    ``iteration_us`` and every read of the MIDI port by ``poll_us``, and
+    messages are delivered to the port once the clock reaches their time.
+    The run ends ``tail_us`` after the last message.
+
+    Creating a Simulator installs the hardware stand-ins, so the firmware
+    modules (winterbloom_sol, rplktrlib, ...) must be imported after it.
+
+    Recorded outputs:
+
+    * ``dac_codes``: ``(time_us, channel, code)`` for each time a CV
+      output's DAC code changes. ``dac_writes`` counts every write.
+    * ``gate_edges``: ``(time_us, gate, value)`` for each gate change.
+    * ``led_writes``: how many times the status LED was written.
+    * ``iterations``: how many times the loop was called.
+
+    With ``record=False``, ``dac_codes`` and ``gate_edges`` are left empty
+    and the counters are all that's kept, so the simulator doesn't
+    allocate as the firmware writes the outputs.
+    """
+
+    def __init__(
+        self, events, iteration_us=500, poll_us=20, tail_us=1000000, record=True
+    ):
+        self.clock = VirtualClock()
+        self.record = record
+        self.events = sorted(events, key=lambda event: event[0])
+        self.iteration_us = iteration_us
+        self.poll_us = poll_us
+        self.end_us = (self.events[-1][0] if self.events else 0) + tail_us
+        self.dac_codes = []
+        self.dac_writes = 0
+        self.gate_edges = []
+        self.led_writes = 0
+        self.iterations = 0
+        self._next_event = 0
+        self._codes = {}
+
+        hardware.install(self)
+        if LIB not in sys.path:
+            sys.path.insert(0, LIB)
+        self._use_virtual_time()
+
+    def _use_virtual_time(self):
+        """Points the firmware's ``time`` module at the virtual clock."""
+        import winterbloom_smolmidi  # noqa: F401
+        import winterbloom_sol  # noqa: F401
+
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None) or ""
+            if not path.startswith(LIB):
+                continue
+            current = getattr(module, "time", None)
+            if current is time or isinstance(current, VirtualClock):
+                module.time = self.clock
+
+    @property
+    def midi_sent(self):
+        """How many bytes the firmware sent out of the USB MIDI port."""
+        return sys.modules["usb_midi"].ports[1].written
+
+    def deliver(self):
+        """Feeds the MIDI port every message that's due."""
+        port = sys.modules["usb_midi"].ports[0]
+        events = self.events
+        now = self.clock.now_us
+        n = self._next_event
+        while n < len(events) and events[n][0] <= now:
+            port.feed(events[n][1])
+            n += 1
+        self._next_event = n
+
+    def dac_write(self, channel, code):
+        self.dac_writes += 1
+        if self._codes.get(channel) != code:
+            self._codes[channel] = code
+            self.dac_codes.append((self.clock.now_us, channel, code))
+
+    def sol(self, **kwargs):
+        """Creates a Sol running on the simulated hardware."""
+        from winterbloom_sol import sol
+
+        return sol.Sol(**kwargs)
+
+    def run(self, sol, loop, mode="run", **kwargs):
+        """Runs ``loop`` with ``sol``'s ``mode`` method (one of MODES)
+        until the end of the script. Extra arguments are passed to the
+        method."""
+        from winterbloom_sol.sol import _StopLoop
+
+        if mode not in MODES:
+            raise ValueError("No such mode '{}'".format(mode))
+        if mode == "run_scheduled" and not self.poll_us:
+            raise ValueError("run_scheduled needs poll_us to move the clock")
+
+        clock = self.clock
+        iteration_us = self.iteration_us
+        end_us = self.end_us
+
+        def timed_loop(*args):
+            loop(*args)
+            self.iterations += 1
+            clock.advance(iteration_us)
+            if clock.now_us >= end_us:
+                raise _StopLoop()
+
+        # Catch any firmware modules imported since the simulator was made.
+        self._use_virtual_time()
+        self.deliver()
+        if mode == "run_async":
+            asyncio.set_event_loop_policy(_VirtualTimePolicy(clock))
+        try:
+            getattr(sol, mode)(timed_loop, **kwargs)
+        finally:
+            if mode == "run_async":
+                asyncio.set_event_loop_policy(None)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The repository root, for solsim. It's appended rather than prepended so
+# that code.py doesn't shadow the standard library's code module.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+"""Tests for solsim.audit, auditing loops defined in this file."""
+
+import os
+import sys
+import time
+
+import pytest
+
+from solsim import Simulator
+from solsim.audit import AllocationAuditor
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(sys, "monitoring"), reason="solsim.audit needs Python 3.12"
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _audit(loop):
+    sim = Simulator([], tail_us=200000)
+    sol = sim.sol()
+    auditor = AllocationAuditor(root=HERE)
+    audited = auditor.audited(loop, warmup=10)
+    try:
+        sim.run(sol, audited)
+    finally:
+        auditor.stop()
+    return auditor
+
+
+def test_retained_tuple_is_counted():
+    kept = []
+
+    def loop(state, message, outputs):
+        kept.append((state.velocity, len(kept)))
+
+    auditor = _audit(loop)
+    assert auditor.per_iteration() > 0.9
+
+
+def test_retained_list_is_counted():
+    kept = []
+
+    def loop(state, message, outputs):
+        kept.append([state.velocity])
+
+    auditor = _audit(loop)
+    assert auditor.per_iteration() > 0.9
+
+
+def test_number_math_is_host_only():
+    level = [0.0, 0]
+
+    def loop(state, message, outputs):
+        level[0] = level[0] * 0.5 + state.velocity / 127 + 1000.25
+        level[1] = (level[1] + 1000) & 0xFFFFF
+
+    auditor = _audit(loop)
+    assert auditor.per_iteration() == 0
+    assert auditor.per_iteration(host=True) > 0.9
+
+
+def test_big_int_is_counted():
+    stamps = [0]
+
+    def loop(state, message, outputs):
+        stamps[0] = time.monotonic_ns() & 0xFFFF
+
+    auditor = _audit(loop)
+    assert auditor.per_iteration() > 0.9
@@ -0,0 +1,81 @@
+"""Tests for winterbloom_sol.clock_tracker, run on the simulator's clock."""
+
+import pytest
+
+from solsim import Simulator
+
+
+@pytest.fixture
+def sim():
+    return Simulator([])
+
+
+def _tick(sim, tracker, count, interval_us, jitter_us=1000):
+    """Ticks the tracker ``count`` times, ``interval_us`` apart starting
+    ``interval_us`` from now, with every other tick ``jitter_us`` late."""
+    import winterbloom_smolmidi as smolmidi
+
+    start = sim.clock.now_us
+    for n in range(count):
+        late = jitter_us if n % 2 else 0
+        sim.clock.advance_to(start + (n + 1) * interval_us + late)
+        tracker.tick(smolmidi.ticks_us())
+
+
+def _interval(bpm):
+    return round(60000000 / (bpm * 24))
+
+
+def test_bpm_follows_a_tempo_change(sim):
+    from winterbloom_sol import ClockTracker
+
+    tracker = ClockTracker()
+    assert tracker.bpm == 0
+    _tick(sim, tracker, 48, _interval(120))
+    assert tracker.bpm == pytest.approx(120, abs=1)
+
+    # A small step is smoothed towards.
+    _tick(sim, tracker, 3, _interval(140))
+    assert 120 < tracker.bpm < 139
+    _tick(sim, tracker, 96, _interval(140))
+    assert tracker.bpm == pytest.approx(140, abs=1)
+
+    # Halving the tempo resets the estimate straight away.
+    _tick(sim, tracker, 2, _interval(70))
+    assert tracker.bpm == pytest.approx(70, abs=1)
+
+
+def test_bpm_smooths_jitter(sim):
+    from winterbloom_sol import ClockTracker
+
+    # About as much jitter as USB MIDI has, on top of the simulated
+    # ticks_us's 1 ms resolution.
+    tracker = ClockTracker()
+    _tick(sim, tracker, 96, _interval(120), jitter_us=1000)
+    assert tracker.bpm == pytest.approx(120, abs=1)
+
+
+def test_phase(sim):
+    from winterbloom_sol import ClockTracker
+
+    tracker = ClockTracker()
+    assert tracker.phase() == 0.0
+
+    # 125 BPM is a tick every 20 ms. After 36 ticks, the last was tick 35.
+    _tick(sim, tracker, 36, 20000)
+    assert tracker.ticks == 35
+    sim.clock.advance(10000)
+    assert tracker.phase(1) == pytest.approx((11 + 0.5) / 24, abs=0.002)
+    assert tracker.phase(0.5) == pytest.approx((11 + 0.5) / 12, abs=0.004)
+    assert tracker.phase(4) == pytest.approx((35 + 0.5) / 96, abs=0.001)
+
+    # The phase stops short of the next tick until it arrives.
+    sim.clock.advance(50000)
+    assert tracker.phase(1) == pytest.approx((11 + 0.999) / 24)
+
+    # START counts from the beginning again, keeping the tempo.
+    tracker.start()
+    assert tracker.phase() == 0.0
+    _tick(sim, tracker, 1, 20000)
+    assert tracker.ticks == 0
+    assert tracker.bpm == pytest.approx(125, abs=1)
@@ -0,0 +1,161 @@
+"""Tests for winterbloom_sol._midi_ext's MIDI inputs."""
+
+import pytest
+
+from solsim import Simulator
+
+
+class _Port:
+    """A MIDI port with all of its data available up front."""
+
+    def __init__(self, data=b""):
+        self._data = bytearray(data)
+
+    def feed(self, data):
+        self._data += data
+
+    def readinto(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        count = min(nbytes, len(self._data))
+        buf[:count] = self._data[:count]
+        del self._data[:count]
+        return count
+
+
+@pytest.fixture(autouse=True)
+def sim():
+    return Simulator([])
+
+
+def _dedup(data):
+    import winterbloom_smolmidi as smolmidi
+    from winterbloom_sol._midi_ext import DeduplicatingMidiIn
+
+    return DeduplicatingMidiIn(smolmidi.MidiIn(_Port(data)))
+
+
+def _receive_all(midi_in):
+    messages = []
+    while True:
+        message = midi_in.receive()
+        if message is None:
+            return messages
+        messages.append(bytes(message))
+
+
+def test_dedup_coalesces_each_slot():
+    midi_in = _dedup(
+        b"\xb0\x01\x01\xb0\x01\x02\xb1\x01\x05\xb0\x01\x03"
+        b"\xe0\x00\x40\xe0\x7f\x7f\xa0\x3c\x10\xa0\x3c\x20\xa0\x3d\x30"
+        b"\xd2\x10\xd2\x11\xf2\x01\x02\xf2\x03\x04"
+    )
+    assert _receive_all(midi_in) == [
+        b"\xb0\x01\x03",
+        b"\xb1\x01\x05",
+        b"\xe0\x7f\x7f",
+        b"\xa0\x3c\x20",
+        b"\xa0\x3d\x30",
+        b"\xd2\x11",
+        b"\xf2\x03\x04",
+    ]
+
+
+def test_dedup_keeps_other_messages_in_order():
+    midi_in = _dedup(
+        b"\xb0\x01\x01\xb0\x07\x05\x90\x3c\x64\xb0\x01\x02"
+        b"\xb0\x07\x06\xb0\x01\x03\x80\x3c\x00\xb0\x07\x07"
+    )
+    # Slots that changed before a message are returned before it, in the
+    # order they first changed.
+    assert _receive_all(midi_in) == [
+        b"\xb0\x01\x01",
+        b"\xb0\x07\x05",
+        b"\x90\x3c\x64",
+        b"\xb0\x01\x03",
+        b"\xb0\x07\x06",
+        b"\x80\x3c\x00",
+        b"\xb0\x07\x07",
+    ]
+
+
+def test_dedup_returns_real_time_first():
+    # The clock skips ahead of the change queued before it.
+    midi_in = _dedup(b"\xb0\x01\x01\xf8\xb0\x01\x02")
+    assert _receive_all(midi_in) == [b"\xf8", b"\xb0\x01\x01", b"\xb0\x01\x02"]
+
+
+def test_dedup_keeps_the_last_message_valid():
+    # Nothing real-time arrives, so receive mustn't use up the pool checking
+    # for it and hand out the message it returned last time again.
+    midi_in = _dedup(b"\xb0\x01\x0a\xb0\x02\x14")
+    first = midi_in.receive()
+    assert bytes(first) == b"\xb0\x01\x0a"
+    second = midi_in.receive()
+    assert second is not first
+    assert bytes(first) == b"\xb0\x01\x0a"
+    assert bytes(second) == b"\xb0\x02\x14"
+
+
+class _Input:
+    """A MIDI input that returns the given (timestamp, bytes) messages."""
+
+    def __init__(self, messages, error_count=0):
+        self._messages = [m for m in messages if m[1][0] < 0xF8]
+        self._realtime = [m for m in messages if m[1][0] >= 0xF8]
+        self.error_count = error_count
+
+    def _next(self, messages, into):
+        if not messages:
+            return None
+        timestamp, data = messages.pop(0)
+        into.type = data[0] if data[0] >= 0xF0 else data[0] & 0xF0
+        into.channel = None if data[0] >= 0xF0 else data[0] & 0x0F
+        into._set_data(len(data) - 1, *(data[1:] + b"\x00\x00")[:2])
+        into.timestamp = timestamp
+        return into
+
+    def receive_realtime(self, into):
+        return self._next(self._realtime, into)
+
+    def receive(self, into):
+        return self._next(self._messages, into)
+
+
+def _merged(*inputs):
+    from winterbloom_sol._midi_ext import MergedMidiIn
+
+    return MergedMidiIn(inputs)
+
+
+def test_merged_orders_by_timestamp():
+    usb = _Input([(100, b"\x90\x3c\x64"), (400, b"\x80\x3c\x00"), (450, b"\xf8")])
+    din = _Input([(50, b"\xb0\x01\x01"), (300, b"\xf8"), (350, b"\xb0\x01\x02")])
+    merged = _merged(usb, din)
+    # Real-time messages first, then everything else in order.
+    assert _receive_all(merged) == [
+        b"\xf8",
+        b"\xf8",
+        b"\xb0\x01\x01",
+        b"\x90\x3c\x64",
+        b"\xb0\x01\x02",
+        b"\x80\x3c\x00",
+    ]
+
+
+def test_merged_orders_across_the_tick_wrap():
+    end = (1 << 30) - 100
+    usb = _Input([(end, b"\x90\x3c\x64"), (50, b"\x80\x3c\x00")])
+    din = _Input([(end + 50, b"\xb0\x01\x01"), (10, b"\xb0\x01\x02")])
+    assert _receive_all(_merged(usb, din)) == [
+        b"\x90\x3c\x64",
+        b"\xb0\x01\x01",
+        b"\xb0\x01\x02",
+        b"\x80\x3c\x00",
+    ]
+
+
+def test_merged_error_counts():
+    merged = _merged(_Input([], error_count=2), _Input([], error_count=3))
+    assert merged.error_counts == (2, 3)
+    assert merged.error_count == 5
@@ -0,0 +1,24 @@
+"""Tests for rplktrlib.RedBlue, run on the simulator."""
+
+from solsim import Simulator
+from solsim.redblue import red_blue_loop
+
+
+def _run(events):
+    sim = Simulator(events, tail_us=50000)
+    sol = sim.sol()
+    loop, options = red_blue_loop(sol)
+    sim.run(sol, loop, **options)
+    return sim
+
+
+def test_controllers_on_any_channel():
+    # The foot pedal (CC4) on channel 3 opens the cutoff on CV C and D.
+    sim = _run([(0, b"\x90\x3c\x40"), (10000, b"\xb2\x04\x7f")])
+    codes = [code for time_us, channel, code in sim.dac_codes if channel == "c"]
+    assert codes[-1] > codes[0]
+
+
+def test_notes_on_other_channels_are_ignored():
+    sim = _run([(0, b"\x90\x3c\x40"), (10000, b"\x92\x40\x40")])
+    assert [gate for time_us, gate, value in sim.gate_edges if gate < 4] == [1, 2, 3]
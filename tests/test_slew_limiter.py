@@ -0,0 +1,26 @@
+"""Tests for winterbloom_sol.slew_limiter, run on the simulator."""
+
+from solsim import Simulator
+
+# supervisor.ticks_ms wraps around at 2**29 milliseconds.
+_TICKS_PERIOD_MS = 1 << 29
+
+
+def test_active_across_the_tick_wrap():
+    sim = Simulator([])
+    from winterbloom_sol.slew_limiter import SlewLimiter
+
+    # 50 ms before supervisor.ticks_ms wraps around.
+    sim.clock.advance((_TICKS_PERIOD_MS - 50) * 1000)
+    slew = SlewLimiter(0.1)
+    slew.target = 0.0
+    slew.target = 10.0
+    assert slew.active
+
+    sim.clock.advance(60 * 1000)
+    assert slew.active
+    assert 5.0 < slew.output < 7.0
+
+    sim.clock.advance(50 * 1000)
+    assert not slew.active
+    assert slew.output == 10.0
@@ -0,0 +1,308 @@
+"""Tests for winterbloom_smolmidi's parsers and MidiOut."""
+
+import pytest
+
+from solsim import Simulator
+
+
+class _Port:
+    """A MIDI port with all of its data available up front, that hands it
+    out at most ``chunk`` bytes at a time, like a USB port does a packet at
+    a time. Written bytes are kept in ``written``."""
+
+    def __init__(self, data=b"", chunk=None):
+        self._data = bytearray(data)
+        self._chunk = chunk
+        self.written = bytearray()
+
+    @property
+    def pending(self):
+        return len(self._data)
+
+    def readinto(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        if self._chunk is not None:
+            nbytes = min(nbytes, self._chunk)
+        count = min(nbytes, len(self._data))
+        buf[:count] = self._data[:count]
+        del self._data[:count]
+        return count
+
+    def write(self, buf):
+        self.written += buf
+        return len(buf)
+
+
+@pytest.fixture(autouse=True)
+def sim():
+    return Simulator([])
+
+
+@pytest.fixture(params=["MidiIn", "BufferedMidiIn"])
+def midi_in_cls(request):
+    import winterbloom_smolmidi as smolmidi
+
+    return getattr(smolmidi, request.param)
+
+
+def _receive_all(midi_in, port):
+    """Returns every message the port has, as bytes. The parsers return
+    None for dropped messages and partial reads, so this keeps going until
+    the port is empty."""
+    messages = []
+    while True:
+        message = midi_in.receive()
+        if message is not None:
+            messages.append(bytes(message))
+        elif not port.pending:
+            return messages
+
+
+# Every kind of message with data bytes, and a system common message.
+_STREAM = [
+    b"\x90\x3c\x64",
+    b"\x81\x3c\x00",
+    b"\xa2\x3c\x10",
+    b"\xb3\x01\x7f",
+    b"\xc4\x05",
+    b"\xd5\x20",
+    b"\xe6\x00\x40",
+    b"\xf2\x10\x20",
+    b"\xf3\x02",
+    b"\xf6",
+]
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 5, 7, 64])
+def test_buffered_midi_in_reads_in_any_size_of_chunk(chunk):
+    import winterbloom_smolmidi as smolmidi
+
+    port = _Port(b"".join(_STREAM) * 3, chunk=chunk)
+    midi_in = smolmidi.BufferedMidiIn(port, buffer_size=16, read_size=8)
+    assert _receive_all(midi_in, port) == _STREAM * 3
+    assert midi_in.error_count == 0
+
+
+def test_midi_in_running_status(midi_in_cls):
+    port = _Port(b"\x90\x3c\x64\x3e\x64\xb1\x01\x10\x02\x20")
+    midi_in = midi_in_cls(port, enable_running_status=True)
+    assert _receive_all(midi_in, port) == [
+        b"\x90\x3c\x64",
+        b"\x90\x3e\x64",
+        b"\xb1\x01\x10",
+        b"\xb1\x02\x20",
+    ]
+
+
+def test_midi_in_without_running_status_drops_data_bytes(midi_in_cls):
+    port = _Port(b"\x90\x3c\x64\x3e\x64\x80\x3c\x00")
+    midi_in = midi_in_cls(port)
+    assert _receive_all(midi_in, port) == [b"\x90\x3c\x64", b"\x80\x3c\x00"]
+    assert midi_in.error_count > 0
+
+
+@pytest.mark.parametrize("chunk", [1, 64])
+def test_buffered_midi_in_system_common_clears_running_status(chunk):
+    import winterbloom_smolmidi as smolmidi
+
+    port = _Port(b"\x90\x3c\x64\xf3\x02\x3e\x64", chunk=chunk)
+    midi_in = smolmidi.BufferedMidiIn(port, enable_running_status=True)
+    assert _receive_all(midi_in, port) == [b"\x90\x3c\x64", b"\xf3\x02"]
+    assert midi_in.error_count == 2
+
+
+def test_midi_in_skips_unread_sysex(midi_in_cls):
+    port = _Port(b"\xf0\x7d\x01\x02\x03\xf7\x90\x3c\x64\xf0\x7d\xf7\xf6")
+    midi_in = midi_in_cls(port)
+    assert _receive_all(midi_in, port) == [
+        b"\xf0",
+        b"\x90\x3c\x64",
+        b"\xf0",
+        b"\xf6",
+    ]
+    assert midi_in.error_count == 0
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 64])
+def test_buffered_midi_in_real_time_in_the_middle_of_a_message(chunk):
+    import winterbloom_smolmidi as smolmidi
+
+    port = _Port(b"\x90\x3c\xf8\x64\xb0\xfa\x01\xfc\x7f", chunk=chunk)
+    midi_in = smolmidi.BufferedMidiIn(port)
+    messages = _receive_all(midi_in, port)
+    # The real-time messages come out as soon as they're read, and don't
+    # break up the messages they arrived in the middle of.
+    assert [m for m in messages if m[0] < 0xF8] == [b"\x90\x3c\x64", b"\xb0\x01\x7f"]
+    assert [m for m in messages if m[0] >= 0xF8] == [b"\xf8", b"\xfa", b"\xfc"]
+    assert messages.index(b"\xf8") < messages.index(b"\x90\x3c\x64")
+    assert midi_in.error_count == 0
+
+
+def test_buffered_midi_in_receive_realtime_only_returns_real_time():
+    import winterbloom_smolmidi as smolmidi
+
+    port = _Port(b"\x90\x3c\x64\xf8\x80\x3c\x00\xfc")
+    midi_in = smolmidi.BufferedMidiIn(port)
+    assert bytes(midi_in.receive_realtime()) == b"\xf8"
+    assert bytes(midi_in.receive_realtime()) == b"\xfc"
+    assert midi_in.receive_realtime() is None
+    assert _receive_all(midi_in, port) == [b"\x90\x3c\x64", b"\x80\x3c\x00"]
+
+
+_SYSEX_DATA = bytes(range(10))
+
+
+def _sysex_then_note(midi_in_cls, chunk=None):
+    port = _Port(b"\xf0" + _SYSEX_DATA + b"\xf7\x90\x3c\x64", chunk=chunk)
+    midi_in = midi_in_cls(port)
+    assert bytes(midi_in.receive()) == b"\xf0"
+    return midi_in, port
+
+
+@pytest.mark.parametrize("chunk", [1, 4, 64])
+def test_receive_sysex_into_streams_chunks(midi_in_cls, chunk):
+    midi_in, port = _sysex_then_note(midi_in_cls, chunk)
+    chunks = []
+
+    def on_chunk(buf, length):
+        chunks.append(bytes(buf[:length]))
+
+    assert midi_in.receive_sysex_into(bytearray(4), on_chunk) == (10, False)
+    assert chunks == [_SYSEX_DATA[:4], _SYSEX_DATA[4:8], _SYSEX_DATA[8:]]
+    assert _receive_all(midi_in, port) == [b"\x90\x3c\x64"]
+
+
+def test_receive_sysex_into_truncates_without_on_chunk(midi_in_cls):
+    midi_in, port = _sysex_then_note(midi_in_cls)
+    buf = bytearray(4)
+    assert midi_in.receive_sysex_into(buf) == (4, True)
+    assert buf == _SYSEX_DATA[:4]
+    assert _receive_all(midi_in, port) == [b"\x90\x3c\x64"]
+
+
+def test_receive_sysex_into_a_memoryview(midi_in_cls):
+    midi_in, port = _sysex_then_note(midi_in_cls)
+    buf = bytearray(16)
+    assert midi_in.receive_sysex_into(memoryview(buf)[2:14]) == (10, False)
+    assert buf[2:12] == _SYSEX_DATA
+
+
+def _midi_out(**kwargs):
+    import winterbloom_smolmidi as smolmidi
+
+    port = _Port()
+    return smolmidi.MidiOut(port, **kwargs), port
+
+
+def test_midi_out_running_status():
+    import winterbloom_smolmidi as smolmidi
+
+    midi_out, port = _midi_out()
+    midi_out.write(smolmidi.NOTE_ON, 0, 60, 100)
+    midi_out.write(smolmidi.NOTE_ON, 0, 64, 100)
+    # Real-time messages don't affect running status.
+    midi_out.write(smolmidi.CLOCK)
+    midi_out.write(smolmidi.NOTE_ON, 0, 67, 100)
+    midi_out.write(smolmidi.NOTE_ON, 1, 60, 100)
+    midi_out.write(smolmidi.PROGRAM_CHANGE, 1, 5)
+    assert port.written == b""
+    midi_out.flush()
+    assert port.written == b"\x90\x3c\x64\x40\x64\xf8\x43\x64\x91\x3c\x64\xc1\x05"
+
+
+def test_midi_out_resends_status_after_system_message():
+    import winterbloom_smolmidi as smolmidi
+
+    midi_out, port = _midi_out()
+    midi_out.write(smolmidi.CC, 2, 1, 10)
+    midi_out.write(smolmidi.SONG_SELECT, data_0=3)
+    midi_out.write(smolmidi.CC, 2, 1, 20)
+    midi_out.write(smolmidi.TUNE_REQUEST)
+    midi_out.write(smolmidi.CC, 2, 1, 30)
+    midi_out.flush()
+    assert port.written == b"\xb2\x01\x0a\xf3\x03\xb2\x01\x14\xf6\xb2\x01\x1e"
+
+
+def test_midi_out_without_running_status():
+    import winterbloom_smolmidi as smolmidi
+
+    midi_out, port = _midi_out(enable_running_status=False)
+    message = smolmidi.Message()
+    message.type = smolmidi.NOTE_OFF
+    message.channel = 3
+    message._set_data(2, 60, 0)
+    midi_out.send(message)
+    midi_out.send(message)
+    midi_out.flush()
+    assert port.written == b"\x83\x3c\x00\x83\x3c\x00"
+
+
+def test_midi_out_flushes_when_full():
+    import winterbloom_smolmidi as smolmidi
+
+    midi_out, port = _midi_out(buffer_size=4)
+    midi_out.write(smolmidi.NOTE_ON, 0, 60, 100)
+    midi_out.write(smolmidi.NOTE_ON, 0, 64, 100)
+    assert port.written == b"\x90\x3c\x64"
+    midi_out.flush()
+    assert port.written == b"\x90\x3c\x64\x40\x64"
+
+
+# BufferedMidiIn returns real-time messages first, so they're at the start.
+_FILTERED = [
+    b"\xf8",
+    b"\xfe",
+    b"\x90\x3c\x64",
+    b"\x99\x24\x64",
+    b"\xb0\x07\x10",
+    b"\xb5\x07\x20",
+    b"\xb0\x01\x30",
+    b"\xc0\x05",
+    b"\xc1\x06",
+]
+
+
+def _filtered(midi_in_cls, *filters):
+    port = _Port(b"".join(_FILTERED))
+    midi_in = midi_in_cls(port)
+    for method, kwargs in filters:
+        getattr(midi_in, method)(**kwargs)
+    return _receive_all(midi_in, port), midi_in
+
+
+def test_ignore(midi_in_cls):
+    import winterbloom_smolmidi as smolmidi
+
+    messages, midi_in = _filtered(
+        midi_in_cls,
+        ("ignore", dict(message_type=smolmidi.ACTIVE_SENSING)),
+        ("ignore", dict(channel=9)),
+        ("ignore", dict(message_type=smolmidi.PROGRAM_CHANGE, channel=0)),
+        ("ignore", dict(message_type=smolmidi.CC, controller=7)),
+    )
+    assert messages == [b"\xf8", b"\x90\x3c\x64", b"\xb0\x01\x30", b"\xc1\x06"]
+    assert midi_in.error_count == 0
+
+
+def test_accept_undoes_ignore(midi_in_cls):
+    import winterbloom_smolmidi as smolmidi
+
+    messages, _ = _filtered(
+        midi_in_cls,
+        ("ignore", dict()),
+        ("accept", dict(channel=0)),
+        ("accept", dict(message_type=smolmidi.CLOCK)),
+        ("ignore", dict(controller=1)),
+    )
+    assert messages == [b"\xf8", b"\x90\x3c\x64", b"\xb0\x07\x10", b"\xc0\x05"]
+
+
+def test_controller_filters_only_apply_to_cc_on_all_channels(midi_in_cls):
+    import winterbloom_smolmidi as smolmidi
+
+    midi_in = midi_in_cls(_Port())
+    with pytest.raises(ValueError):
+        midi_in.ignore(smolmidi.NOTE_ON, controller=7)
+    with pytest.raises(ValueError):
+        midi_in.ignore(smolmidi.CC, channel=0, controller=7)
@@ -0,0 +1,150 @@
+"""Tests for winterbloom_sol.sol, run on the simulator."""
+
+import random
+
+import pytest
+
+from solsim import Simulator
+
+
+def test_status_led_draws_after_long_idle():
+    sim = Simulator([])
+    led = sim.sol().outputs.led
+    led.spin()
+    led.step()
+
+    # Longer than half the ticks_us period.
+    sim.clock.advance(700 * 1000000)
+    writes = sim.led_writes
+    for _ in range(20):
+        led.spin()
+        led.step()
+        sim.clock.advance(50000)
+    assert sim.led_writes - writes == 20
+    assert not led.active
+
+
+def test_held_notes_matches_list():
+    Simulator([])
+    from winterbloom_sol.sol import HeldNotes
+
+    rng = random.Random(20)
+    notes = HeldNotes()
+    model = []
+    for _ in range(200000):
+        op = rng.random()
+        note = rng.randrange(128)
+        if op < 0.0005:
+            notes.clear()
+            model.clear()
+        elif op < 0.55:
+            notes.add(note)
+            if note in model:
+                model.remove(note)
+            model.append(note)
+        else:
+            notes.discard(note)
+            if note in model:
+                model.remove(note)
+
+        assert len(notes) == len(model)
+        assert (note in notes) == (note in model)
+        assert notes.latest == (model[-1] if model else None)
+        assert notes.oldest == (model[0] if model else None)
+        assert notes.highest == (max(model) if model else None)
+        assert notes.lowest == (min(model) if model else None)
+        if model:
+            index = rng.randrange(-len(model), len(model))
+            assert notes[index] == model[index]
+        assert list(notes) == model
+
+
+
+def _run_scheduled(stall_us, rate):
+    sim = Simulator([], iteration_us=0, tail_us=500000)
+    sol = sim.sol()
+    calls = []
+
+    def loop(state, messages, outputs):
+        calls.append(sim.clock.now_us)
+        # Hold up the loop once, 200 ms in.
+        if len(calls) == rate // 5 + 1:
+            sim.clock.advance(stall_us)
+
+    sim.run(sol, loop, mode="run_scheduled", rate=rate)
+    return sol, calls
+
+
+@pytest.mark.parametrize("rate", [100, 1000])
+def test_run_scheduled_runs_at_a_fixed_rate(rate):
+    sol, calls = _run_scheduled(0, rate)
+    assert sol.overruns == 0
+    assert len(calls) == rate // 2
+    # Each call is late by up to one poll of the MIDI port, but that
+    # doesn't add up.
+    period = 1000000 // rate
+    assert all(abs(b - a - period) < 100 for a, b in zip(calls, calls[1:]))
+    assert abs(calls[-1] - calls[0] - period * (len(calls) - 1)) < 100
+
+
+def test_run_scheduled_skips_and_counts_missed_deadlines():
+    # A 100 ms stall misses 100 deadlines at 1 kHz, which are skipped
+    # rather than run back to back.
+    sol, calls = _run_scheduled(100000, 1000)
+    assert sol.overruns == 100
+    assert len(calls) == 400
+    assert abs(max(b - a for a, b in zip(calls, calls[1:])) - 101000) < 100
+
+    # Running over by less than a period doesn't miss any.
+    sol, calls = _run_scheduled(800, 1000)
+    assert sol.overruns == 0
+    assert len(calls) == 500
+
+
+def _run_async(stall_us):
+    sim = Simulator([], iteration_us=0, tail_us=500000)
+    sol = sim.sol()
+    stalled = [False]
+
+    def loop(state, messages, outputs):
+        # Hold up every task once, 200 ms in.
+        if not stalled[0] and sim.clock.now_us > 200000:
+            stalled[0] = True
+            sim.clock.advance(stall_us)
+
+    sim.run(sol, loop, mode="run_async")
+    return sol
+
+
+def test_run_async_skips_and_counts_missed_deadlines():
+    # The simulated event loop makes the 1 kHz tasks miss some deadlines
+    # without a stall as well.
+    steady = _run_async(0)
+    stalled = _run_async(100000)
+
+    # The loop and trigger tasks run at 1 kHz, the LED task at 50 Hz.
+    assert 80 <= stalled.overruns - steady.overruns <= 100
+    assert 80 <= stalled.trigger_overruns - steady.trigger_overruns <= 100
+    assert steady.led_overruns == 0
+    assert 4 <= stalled.led_overruns <= 5
+
+
+def test_outputs_properties_on_the_class():
+    sim = Simulator([])
+    outputs = sim.sol().outputs
+    cls = type(outputs)
+    assert cls.cv_a is cls.__dict__["cv_a"]
+    assert cls.gate_1 is cls.__dict__["gate_1"]
+    assert cls.trigger_gate_1 is cls.__dict__["trigger_gate_1"]
+
+
+def test_beta_board_has_no_cv_c_or_d(monkeypatch):
+    sim = Simulator([])
+    from winterbloom_sol import _utils
+
+    monkeypatch.setattr(_utils, "is_beta", lambda: True)
+    outputs = sim.sol().outputs
+    outputs.cv_b = 1.0
+    assert not hasattr(outputs, "cv_c")
+    with pytest.raises(AttributeError):
+        outputs.cv_d = 1.0
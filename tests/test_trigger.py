@@ -0,0 +1,81 @@
+"""Tests for winterbloom_sol.trigger, run on the simulator."""
+
+import pytest
+
+from solsim import Simulator
+from solsim.redblue import red_blue_loop
+
+
+def _note(time_us, status, note, velocity=100):
+    return (time_us, bytes((status, note, velocity)))
+
+
+def test_clock_read_with_heap_locked_raises():
+    sim = Simulator([])
+    import micropython
+    import winterbloom_sol.adsr as adsr
+
+    micropython.heap_lock()
+    try:
+        with pytest.raises(MemoryError):
+            adsr.time.monotonic_ns()
+    finally:
+        micropython.heap_unlock()
+    assert adsr.time is sim.clock
+
+
+def test_retrigger_with_heap_locked():
+    # Overlapping notes on channel 2 retrigger the gates from inside
+    # RedBlue.update, which locks the heap.
+    events = []
+    for n in range(20):
+        start = n * 100000
+        events.append(_note(start, 0x91, 60))
+        events.append(_note(start + 5000, 0x91, 64))
+        events.append(_note(start + 10000, 0x91, 67))
+        events.append(_note(start + 50000, 0x81, 60, 0))
+        events.append(_note(start + 50000, 0x81, 64, 0))
+        events.append(_note(start + 50000, 0x81, 67, 0))
+    sim = Simulator(events, tail_us=100000)
+    sol = sim.sol()
+    loop, options = red_blue_loop(sol)
+    sim.run(sol, loop, **options)
+
+    retriggers = [edge for edge in sim.gate_edges if edge[1] == 3 and not edge[2]]
+    assert len(retriggers) >= 20
+
+
+def test_gate_write_cancels_queued_retriggers():
+    # Three notes 5 ms apart on channel 2 queue retriggers on gates 1 and
+    # 3, then all of them are released.
+    events = [
+        _note(0, 0x91, 60),
+        _note(5000, 0x91, 64),
+        _note(10000, 0x91, 67),
+        _note(16000, 0x81, 60, 0),
+        _note(16500, 0x81, 64, 0),
+        _note(17000, 0x81, 67, 0),
+    ]
+    sim = Simulator(events, tail_us=100000)
+    sol = sim.sol()
+    loop, options = red_blue_loop(sol)
+    sim.run(sol, loop, **options)
+
+    released = max(time_us for time_us, gate, value in sim.gate_edges if gate == 3)
+    assert released < 18000
+    after = [edge for edge in sim.gate_edges if edge[0] > released and edge[1] < 4]
+    assert after == []
+    assert not sol.outputs._triggers.active
+
+
+def test_set_gate_cancels_queued_trigger():
+    sim = Simulator([])
+    outputs = sim.sol().outputs
+    outputs.trigger_gate(1)
+    outputs.trigger_gate(1)
+    outputs.gate_1 = False
+    assert not outputs.trigger_gate_1.active
+
+    sim.clock.advance(100000)
+    outputs.step()
+    assert outputs.gate_1 is False